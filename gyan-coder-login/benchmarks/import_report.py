@@ -0,0 +1,91 @@
+"""Import-time report for the app's modules.
+
+Imports each module in a fresh interpreter with ``python -X importtime``
+and reports its total import time and the slowest imports it pulls in,
+so cold-start regressions show up before they reach a deployment.
+
+    python benchmarks/import_report.py
+    python benchmarks/import_report.py --modules gyancoder,chat_store --target-ms 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+DEFAULT_MODULES = ["gyancoder", "llm_engine", "chat_store", "user_store", "session_tokens", "message_parser",
+                   "metrics", "chat_log", "response_cache", "rate_limit", "tokens", "singleflight"]
+
+
+def import_times(module):
+    """Return ([(cumulative_us, self_us, name)], error) for importing module in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=SRC_DIR, env=env)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    error = result.stderr.strip().splitlines()[-1] if result.returncode else None
+    return rows, error
+
+
+def report(module, top):
+    rows, error = import_times(module)
+    if error:
+        return {"module": module, "error": error}
+    # The module's own imports are the nested rows listed just before its top-level row
+    end = next((index for index, (_, _, name) in enumerate(rows) if name == f" {module}"), None)
+    if end is None:
+        return {"module": module, "error": "module not found in -X importtime output"}
+    start = end
+    while start > 0 and rows[start - 1][2].startswith("  "):
+        start -= 1
+    total = rows[end][0]
+    slowest = sorted(rows[start:end], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": round(total / 1000, 1),
+        "slowest": [{"name": name.strip(), "cumulative_ms": round(cumulative / 1000, 1)}
+                    for cumulative, _, name in slowest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES),
+                        help="comma-separated modules to import (default: every app module)")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports listed per module (default: %(default)s)")
+    parser.add_argument("--target-ms", type=float,
+                        help="exit with an error when any module takes longer than this to import")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    reports = [report(module, args.top) for module in args.modules.split(",")]
+    failed = False
+    for entry in reports:
+        if "error" in entry:
+            print(f"{entry['module']:<20} failed: {entry['error']}")
+            failed = True
+            continue
+        over = args.target_ms is not None and entry["total_ms"] > args.target_ms
+        failed = failed or over
+        print(f"{entry['module']:<20}{entry['total_ms']:>9.1f} ms{'  OVER TARGET' if over else ''}")
+        for item in entry["slowest"]:
+            print(f"    {item['name']:<40}{item['cumulative_ms']:>9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version.split()[0], "target_ms": args.target_ms, "modules": reports},
+                      file, indent=2)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
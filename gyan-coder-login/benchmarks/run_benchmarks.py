@@ -0,0 +1,205 @@
+"""Offline micro-benchmarks for the storage, parsing and post-processing hot paths.
+
+Generates synthetic users, chats and responses at several scales, times
+each path and reports latency percentiles and peak memory. No network
+access is needed.
+
+    python benchmarks/run_benchmarks.py --scales 10,1000 --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+from chat_store import ChatStore  # noqa: E402
+from gyancoder import clean_response  # noqa: E402
+from message_parser import parse_segments  # noqa: E402
+from user_store import JsonUserStore, SqliteUserStore, atomic_write_json, hash_password, verify_credentials  # noqa: E402
+
+DEFAULT_SCALES = [10, 1000, 100000]
+
+# Upper bounds on how long and how often a single benchmark is sampled
+MAX_SECONDS = 2.0
+MAX_ITERATIONS = 2000
+
+WORDS = ("list", "python", "reverse", "linked", "sort", "array", "function", "class", "error", "loop",
+         "string", "dictionary", "recursion", "async", "thread", "file", "parse", "index", "query", "cache")
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def synthetic_response(rng, paragraphs):
+    """A model-style reply with <think> blocks, prose and several code blocks."""
+    parts = [f"<think>{sentence(rng, 40)}</think>"]
+    for index in range(paragraphs):
+        parts.append(sentence(rng, 30))
+        if index % 3 == 0:
+            language = rng.choice(["python", "javascript", ""])
+            parts.append(f"```{language}\ndef f{index}(x):\n    return x * {index}\n```")
+        if index % 10 == 0:
+            parts.append(f"<think>{sentence(rng)}</think>")
+    return "\n\n".join(parts)
+
+
+def synthetic_message(rng, role):
+    text = sentence(rng, 20)
+    return {"role": role, "text": text, "segments": [{"type": "text", "text": text}]}
+
+
+def build_chat_store(directory, chats, rng):
+    store = ChatStore(directory)
+    # Durability does not matter for fixture data
+    store.db.execute("PRAGMA synchronous=OFF")
+    chat_ids = []
+    for _ in range(chats):
+        chat_id = store.create_chat(sentence(rng, 6))
+        store.append_message(chat_id, synthetic_message(rng, "user"))
+        store.append_message(chat_id, synthetic_message(rng, "assistant"))
+        chat_ids.append(chat_id)
+    store.db.execute("PRAGMA synchronous=NORMAL")
+    return store, chat_ids
+
+
+def build_users(count):
+    return {f"user{index}": {"password": hash_password(f"secret{index}"), "email": f"user{index}@example.com"}
+            for index in range(count)}
+
+
+def measure(func):
+    """Time func repeatedly and return percentiles (ms) and peak memory (KiB)."""
+    timings = []
+    deadline = time.perf_counter() + MAX_SECONDS
+    while len(timings) < MAX_ITERATIONS and (not timings or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+
+    def percentile(fraction):
+        return round(timings[min(len(timings) - 1, int(fraction * len(timings)))], 4)
+
+    return {
+        "iterations": len(timings),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_scale(scale, workdir):
+    rng = random.Random(scale)
+    results = {}
+
+    # Chat storage: scale = number of chats for one user
+    store, chat_ids = build_chat_store(os.path.join(workdir, f"chats-{scale}"), scale, rng)
+    target_chat = chat_ids[len(chat_ids) // 2]
+    new_chat = store.create_chat("benchmark chat")
+    message = synthetic_message(rng, "assistant")
+    results["chat_store.append_message"] = measure(lambda: store.append_message(new_chat, message))
+    results["chat_store.list_chats(page)"] = measure(lambda: store.list_chats(limit=20))
+    results["chat_store.list_chats(all)"] = measure(lambda: store.list_chats())
+    results["chat_store.load_messages"] = measure(lambda: store.load_messages(target_chat))
+    results["chat_store.search"] = measure(lambda: store.search("recursion thread"))
+    store.db.close()
+
+    # Response post-processing: scale = number of paragraphs, capped to keep replies realistic
+    response = synthetic_response(rng, min(scale, 2000))
+    results["gyancoder.clean_response"] = measure(lambda: clean_response(response))
+    results["message_parser.parse_segments"] = measure(lambda: parse_segments(response))
+
+    # Users: scale = number of registered users
+    users_file = os.path.join(workdir, f"users-{scale}.json")
+    atomic_write_json(users_file, build_users(scale))
+    known_user = f"user{scale // 2}"
+    password = f"secret{scale // 2}"
+    results["user_store.load_users(cold)"] = measure(lambda: JsonUserStore(users_file).all())
+    json_store = JsonUserStore(users_file)
+    results["user_store.verify_user(json)"] = measure(lambda: verify_credentials(json_store, known_user, password))
+    sqlite_store = SqliteUserStore(os.path.join(workdir, f"users-{scale}.db"), import_from=users_file)
+    results["user_store.verify_user(sqlite)"] = measure(
+        lambda: verify_credentials(sqlite_store, known_user, password)
+    )
+    sqlite_store.db.close()
+
+    return results
+
+
+def print_results(results):
+    print(f"{'benchmark':<36}{'scale':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'peak KiB':>11}")
+    for scale, benchmarks in results.items():
+        for name, stats in benchmarks.items():
+            print(f"{name:<36}{scale:>8}{stats['p50_ms']:>11.3f}{stats['p95_ms']:>11.3f}"
+                  f"{stats['p99_ms']:>11.3f}{stats['peak_kib']:>11.1f}")
+
+
+def compare(results, baseline, threshold):
+    """Print p50 changes against a baseline and return the regressed benchmarks."""
+    regressions = []
+    for scale, benchmarks in results.items():
+        for name, stats in benchmarks.items():
+            before = baseline.get(scale, {}).get(name)
+            if not before or not before["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / before["p50_ms"]
+            marker = "  REGRESSION" if ratio > 1 + threshold else ""
+            print(f"{name:<36}{scale:>8}{before['p50_ms']:>11.3f} -> {stats['p50_ms']:>9.3f}  x{ratio:.2f}{marker}")
+            if marker:
+                regressions.append((scale, name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES),
+                        help="comma-separated dataset sizes (default: %(default)s)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="compare p50 latencies against a previous JSON result")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative p50 slowdown reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="gyan-bench-")
+    try:
+        results = {}
+        for scale in (int(value) for value in args.scales.split(",")):
+            print(f"Running scale {scale}...", file=sys.stderr)
+            results[str(scale)] = run_scale(scale, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version.split()[0], "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        print()
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,114 +1,41 @@
 import streamlit as st
-import json
-import hashlib
 import re
 import sys
 import os
-from streamlit.runtime.scriptrunner import get_script_run_ctx
-from streamlit.runtime.runtime import Runtime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from user_store import get_user_store, hash_password, verify_credentials
+from session_tokens import issue_token
+from paths import user_chat_dir
+from assets import stylesheet
+
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
 # Set page config at the very top
 st.set_page_config(page_title="Gyan Coder - Login", page_icon="🔐", layout="centered")
 
 
-st.markdown("""
-    <style>
-    .title-container {
-        display: flex;
-        justify-content: center;
-        margin: 1rem 0;
-    }
-    .main-title {
-        font-size: 2.5rem;
-        font-weight: bold;
-    }
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(stylesheet("app.css"), unsafe_allow_html=True)
 
-st.markdown("""
-    <style>
-    /* Footer styling */
-    .footer {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        right: 0;
-        background-color: transparent;
-        padding: 10px 0;
-        text-align: center;
-        font-size: 14px;
-        color: #333;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        width: 100%;
-        margin-top: 20px;
-        z-index: 100;
-    }
-    
-    .footer-content {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        gap: 15px;
-    }
-    
-    .footer-logo {
-        height: 30px;
-        width: auto;
-    }
-    
-    .footer-text {
-        font-weight: bold;
-        margin: 0 10px;
-    }
-    </style>
-""", unsafe_allow_html=True)
 
-# Load user data from JSON file
+# Load user data (served from the user store's in-memory index)
 def load_users():
-    try:
-        with open("users.json", "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {}
-
-# Save user data to JSON file
-def save_users(users):
-    with open("users.json", "w") as file:
-        json.dump(users, file, indent=4)
-
-# Hash password for security
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    return get_user_store().all()
 
 # Verify user credentials
 def verify_user(username, password):
-    users = load_users()
-    if username in users and users[username]["password"] == hash_password(password):
-        return True
-    return False
+    return verify_credentials(get_user_store(), username, password)
 
 # Create user chat directory
 def create_user_chat_directory(username):
-    # Create the parent directory if it doesn't exist
-    parent_dir = "D:\\gyanstreamlit\\gyan-coder-login\\src\\users_chat"
-    os.makedirs(parent_dir, exist_ok=True)
-    
-    # Create user-specific directory
-    user_dir = os.path.join(parent_dir, username)
-    os.makedirs(user_dir, exist_ok=True)
-    return user_dir
+    # Lives under the configurable data root (GYAN_DATA_ROOT)
+    return user_chat_dir(username)
 
 # Add a new user to the system
 def add_user(username, password, email):
-    users = load_users()
-    if username in users:
+    if not get_user_store().add(username, {"password": hash_password(password), "email": email}):
         return False
-    users[username] = {"password": hash_password(password), "email": email}
-    save_users(users)
     
     # Create chat directory for the new user
     create_user_chat_directory(username)
@@ -116,16 +43,15 @@ def add_user(username, password, email):
 
 # Change user password
 def change_password(username, email, new_password):
-    users = load_users()
-    if username in users and users[username]["email"] == email:
-        users[username]["password"] = hash_password(new_password)
-        save_users(users)
-        return True
+    store = get_user_store()
+    user = store.get(username)
+    if user is not None and user["email"] == email:
+        return store.update(username, password=hash_password(new_password))
     return False
 
 # Validate email format
 def is_valid_email(email):
-    return bool(re.match(r"[^@]+@[^@]+\.[^@]+", email))
+    return bool(EMAIL_PATTERN.match(email))
 
 
 st.markdown('<div class="title-container"><span class="main-title">GYAN CODER LOGIN</span></div>', unsafe_allow_html=True)
@@ -162,6 +88,7 @@ if st.session_state.active_tab == "login":
                 if verify_user(username, password):
                     st.session_state["authenticated"] = True
                     st.session_state["username"] = username  # Store username in session state
+                    st.session_state["session_token"] = issue_token(username)
                     st.success(f"Welcome, {username}!")
                     st.switch_page("pages/chatbot.py")
                 else:
@@ -214,6 +141,7 @@ elif st.session_state.active_tab == "signup":
             st.success(f"Welcome, {new_username}!")
             st.session_state["authenticated"] = True
             st.session_state["username"] = new_username  # Store username in session state
+            st.session_state["session_token"] = issue_token(new_username)
             st.switch_page("pages/chatbot.py")  # Changed from st.rerun() to st.switch_page()
         else:
             st.error("Username already exists. Try another one.")
@@ -0,0 +1,175 @@
+"""Export and import a user's chats as a single gzip-compressed JSONL archive.
+
+    python archive.py export <username> chats.jsonl.gz
+    python archive.py import <username> chats.jsonl.gz
+
+The first line is a header, then one line per chat with its messages and
+a SHA-256 checksum, and a final line with the chat count and a checksum
+over all chat checksums. Chats are written and read one at a time, so
+memory use does not grow with the size of the archive.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import sys
+import time
+
+from chat_store import get_chat_store
+from paths import user_chat_dir
+
+ARCHIVE_FORMAT = "gyan-chat-archive"
+ARCHIVE_VERSION = 1
+
+
+class ArchiveError(Exception):
+    """Raised when an archive is malformed, truncated or fails its checksums."""
+
+
+def chat_checksum(record):
+    """Return the SHA-256 of a chat record's canonical JSON, excluding its own checksum."""
+    payload = {key: value for key, value in record.items() if key != "sha256"}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def check_chat_record(record, line_number):
+    """Raise ArchiveError unless record has every field of a chat and its messages, with the right types."""
+    for field in ("id", "title", "created_at", "updated_at"):
+        if not isinstance(record.get(field), str):
+            raise ArchiveError(f"Chat on line {line_number} has no valid {field!r}.")
+    if not record["id"]:
+        raise ArchiveError(f"Chat on line {line_number} has an empty 'id'.")
+    if not isinstance(record.get("summary"), (str, type(None))):
+        raise ArchiveError(f"Chat on line {line_number} has an invalid 'summary'.")
+    summary_upto = record.get("summary_upto")
+    if summary_upto is not None and (type(summary_upto) is not int or summary_upto < 0):
+        raise ArchiveError(f"Chat on line {line_number} has an invalid 'summary_upto'.")
+    if not isinstance(record.get("messages"), list):
+        raise ArchiveError(f"Chat on line {line_number} has no valid 'messages'.")
+    for index, message in enumerate(record["messages"]):
+        if not _valid_message(message):
+            raise ArchiveError(f"Message {index} of the chat on line {line_number} is malformed.")
+
+
+def _valid_message(message):
+    if not isinstance(message, dict) or not isinstance(message.get("role"), str):
+        return False
+    if not isinstance(message.get("text"), (str, type(None))) or not isinstance(message.get("segments"), list):
+        return False
+    for segment in message["segments"]:
+        if not isinstance(segment, dict):
+            return False
+        if segment.get("type") == "text":
+            valid = isinstance(segment.get("text"), str)
+        elif segment.get("type") == "code":
+            valid = isinstance(segment.get("code"), str) and isinstance(segment.get("lang"), (str, type(None)))
+        else:
+            valid = False
+        if not valid:
+            return False
+    return True
+
+
+def export_archive(store, target, username=None):
+    """Write every chat in store to target (a path or binary file object). Returns the number of chats."""
+    count = 0
+    digest = hashlib.sha256()
+    with gzip.open(target, "wt", encoding="utf-8") as archive:
+        header = {"format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION, "user": username,
+                  "exported_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        archive.write(json.dumps(header) + "\n")
+        for chat in store.iter_chats():
+            record = dict(chat, type="chat", messages=store.load_messages(chat["id"]))
+            record["sha256"] = chat_checksum(record)
+            digest.update(record["sha256"].encode("ascii"))
+            archive.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+        archive.write(json.dumps({"type": "end", "chats": count, "sha256": digest.hexdigest()}) + "\n")
+    return count
+
+
+def read_archive(source):
+    """Yield the verified chat records of an archive (a path or binary file object).
+
+    Raises ArchiveError on a bad header, checksum or chat record, or when
+    the archive ends before its end record; chats yielded before that
+    were intact.
+    """
+    try:
+        yield from _read_records(source)
+    except (EOFError, gzip.BadGzipFile, UnicodeDecodeError) as e:
+        raise ArchiveError(f"Archive is damaged or truncated: {e}")
+
+
+def _read_records(source):
+    digest = hashlib.sha256()
+    count = 0
+    with gzip.open(source, "rt", encoding="utf-8") as archive:
+        try:
+            header = json.loads(archive.readline() or "null")
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != ARCHIVE_FORMAT:
+            raise ArchiveError("Not a chat archive.")
+        if header.get("version", 0) > ARCHIVE_VERSION:
+            raise ArchiveError(f"Archive version {header['version']} is newer than this app supports.")
+
+        for line_number, line in enumerate(archive, 2):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ArchiveError(f"Line {line_number} is not valid JSON; the archive may be truncated.")
+            if not isinstance(record, dict):
+                raise ArchiveError(f"Line {line_number} is not a chat record.")
+            if record.get("type") == "end":
+                if record.get("chats") != count or record.get("sha256") != digest.hexdigest():
+                    raise ArchiveError("Archive checksum does not match its contents.")
+                return
+            if record.get("sha256") != chat_checksum(record):
+                raise ArchiveError(f"Checksum mismatch for chat on line {line_number}.")
+            check_chat_record(record, line_number)
+            digest.update(record["sha256"].encode("ascii"))
+            count += 1
+            yield record
+        raise ArchiveError("Archive ends before its end record; it may be truncated.")
+
+
+def import_archive(store, source):
+    """Import the chats of an archive into store, skipping chats it already has.
+
+    Returns {"imported": n, "duplicates": n}. Each chat is committed on its
+    own, so importing the same archive again after an error is safe.
+    """
+    result = {"imported": 0, "duplicates": 0}
+    for record in read_archive(source):
+        if store.import_chat(record, record["messages"]):
+            result["imported"] += 1
+        else:
+            result["duplicates"] += 1
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("username")
+    parser.add_argument("archive", help="archive file (.jsonl.gz)")
+    args = parser.parse_args()
+
+    store = get_chat_store(user_chat_dir(args.username))
+    try:
+        if args.command == "export":
+            count = export_archive(store, args.archive, username=args.username)
+            print(f"Exported {count} chats to {args.archive}")
+        else:
+            result = import_archive(store, args.archive)
+            print(f"Imported {result['imported']} chats, skipped {result['duplicates']} already present")
+    except (ArchiveError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import os
+import re
+import sys
+from functools import lru_cache
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stylesheets injected by the pages
+STYLES_DIR = os.path.join(SRC_DIR, "styles")
+
+# Served by Streamlit at /app/static/ when server.enableStaticServing is on (see .streamlit/config.toml)
+STATIC_DIR = os.path.join(SRC_DIR, "static")
+STATIC_URL = "app/static"
+
+# Sidebar logo source and the width it is resized to (twice the sidebar width, for high-DPI screens)
+LOGO_SOURCE = os.path.join(SRC_DIR, "assets", "codingbot.png")
+LOGO_WIDTH = 480
+
+_CSS_COMMENTS = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_WHITESPACE = re.compile(r"\s+")
+_CSS_PUNCTUATION = re.compile(r"\s*([{};:,>])\s*")
+
+
+def minify_css(css):
+    """Strip comments and redundant whitespace from a stylesheet."""
+    css = _CSS_COMMENTS.sub("", css)
+    css = _CSS_WHITESPACE.sub(" ", css)
+    css = _CSS_PUNCTUATION.sub(r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+@lru_cache(maxsize=None)
+def stylesheet(*names):
+    """Return a <style> tag with the named files from STYLES_DIR, minified.
+
+    Read and minified once per process; pages still emit the tag on every
+    run because Streamlit drops elements a rerun does not re-create.
+    """
+    parts = []
+    for name in names:
+        with open(os.path.join(STYLES_DIR, name), "r", encoding="utf-8") as file:
+            parts.append(minify_css(file.read()))
+    return "<style>" + "".join(parts) + "</style>"
+
+
+def thumbnail(source, width, target_dir=STATIC_DIR):
+    """Return the path of a PNG copy of source scaled down to width pixels.
+
+    The copy is written next to the other static files the first time it
+    is needed and regenerated only when the source is newer. Returns the
+    source itself when Pillow is not available.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    target = os.path.join(target_dir, f"{stem}-{width}.png")
+    try:
+        if os.path.getmtime(target) >= os.path.getmtime(source):
+            return target
+    except OSError:
+        pass
+    try:
+        from PIL import Image
+    except ImportError:
+        return source
+
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(source) as image:
+        image.thumbnail((width, width * 4))
+        temp_target = f"{target}.{os.getpid()}.tmp"
+        image.save(temp_target, format="PNG", optimize=True)
+    os.replace(temp_target, target)
+    return target
+
+
+def static_url(path):
+    """Return the URL of a file under STATIC_DIR, or None when it lies outside it."""
+    relative = os.path.relpath(path, STATIC_DIR)
+    if relative.startswith(os.pardir):
+        return None
+    return f"{STATIC_URL}/{relative.replace(os.sep, '/')}"
+
+
+def build():
+    """Generate the static assets ahead of time, e.g. while building a container image."""
+    path = thumbnail(LOGO_SOURCE, LOGO_WIDTH)
+    print(f"{path} ({os.path.getsize(path) // 1024} KiB)")
+
+
+if __name__ == "__main__":
+    sys.exit(build())
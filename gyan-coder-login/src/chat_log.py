@@ -0,0 +1,143 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from paths import DATA_ROOT
+
+# Directory holding the active log and its rotated segments
+LOG_DIR = os.getenv("GYAN_LOG_DIR", DATA_ROOT)
+
+# Name of the active log file
+LOG_FILENAME = "chat_log.jsonl"
+
+# Rotate once the active file is larger than this many bytes...
+ROTATE_BYTES = int(os.getenv("GYAN_LOG_ROTATE_BYTES", str(50 * 1024 * 1024)))
+
+# ...or older than this many seconds
+ROTATE_SECONDS = float(os.getenv("GYAN_LOG_ROTATE_SECONDS", str(24 * 3600)))
+
+# Records waiting to be written before new ones are dropped
+QUEUE_SIZE = int(os.getenv("GYAN_LOG_QUEUE_SIZE", "10000"))
+
+# Maximum number of records written per batch
+BATCH_SIZE = 256
+
+# Seconds between flushes when records trickle in
+FLUSH_INTERVAL = 1.0
+
+_STOP = object()
+
+
+class LogWriter:
+    """Writes structured JSONL log records from a background thread.
+
+    ``write`` only enqueues, so logging adds no I/O to the request path.
+    The writer thread appends records in batches, rotates the file by size
+    or age and gzip-compresses rotated segments. When the queue is full,
+    records are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, filename=LOG_FILENAME, rotate_bytes=ROTATE_BYTES,
+                 rotate_seconds=ROTATE_SECONDS, queue_size=QUEUE_SIZE):
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, filename)
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.file = None
+        self.opened_at = None
+        os.makedirs(log_dir, exist_ok=True)
+
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        """Queue a record (a JSON-serializable dict) for writing."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5):
+        """Flush queued records and stop the writer thread."""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = _STOP in batch
+            records = [record for record in batch if record is not _STOP]
+            try:
+                if records:
+                    self._write_batch(records)
+            except Exception:
+                # Losing a batch of log records is better than killing the writer
+                self.dropped += len(records)
+            if stopping:
+                self._close_file()
+                return
+
+    def _write_batch(self, records):
+        if self.file is None:
+            self._open_file()
+        elif self._should_rotate():
+            self._rotate()
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        self.file.write(lines)
+        self.file.flush()
+
+    def _open_file(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.opened_at = time.time()
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _should_rotate(self):
+        return (self.file.tell() >= self.rotate_bytes
+                or time.time() - self.opened_at >= self.rotate_seconds)
+
+    def _rotate(self):
+        self._close_file()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{stamp}{ext}"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+        self._open_file()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """Return the process-wide LogWriter, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter()
+            atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,331 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from message_parser import normalize_message
+
+# Database file kept in each user's chat directory
+DB_FILENAME = "chats.db"
+
+# Maximum length of a chat title taken from its first query
+TITLE_LENGTH = 50
+
+# Words of context around each match in search snippets
+SNIPPET_WORDS = 12
+
+# Chat stores kept open at once; the least recently used one is closed beyond this
+OPEN_STORES = int(os.getenv("GYAN_OPEN_CHAT_STORES", "64"))
+
+_SEARCH_TERMS = re.compile(r"\w+")
+
+_stores = OrderedDict()
+_stores_lock = threading.Lock()
+
+
+def get_chat_store(user_dir):
+    """Return the ChatStore for a user's chat directory, opening it on first use.
+
+    Only the OPEN_STORES most recently used stores stay open; older ones
+    have their connection closed and reopen it if they are used again.
+    """
+    user_dir = Path(user_dir).resolve()
+    evicted = []
+    with _stores_lock:
+        store = _stores.get(user_dir)
+        if store is None:
+            store = ChatStore(user_dir)
+            _stores[user_dir] = store
+        else:
+            _stores.move_to_end(user_dir)
+        while len(_stores) > max(OPEN_STORES, 1):
+            evicted.append(_stores.popitem(last=False)[1])
+    # Closed outside _stores_lock: close() waits for the store's own lock
+    for old_store in evicted:
+        old_store.close()
+    return store
+
+
+def now_timestamp():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ChatStore:
+    """Append-only chat storage for one user, backed by SQLite in WAL mode.
+
+    Every chat has a stable random ID and messages are appended one row at a
+    time inside a transaction, so saving never rewrites earlier messages.
+    A per-user lock serializes writers inside the process; SQLite's own
+    locking covers other processes.
+
+    The ``chats`` table doubles as the manifest: title, last update and
+    message count are kept up to date as messages are appended, so listing
+    chats never touches message bodies.
+    """
+
+    def __init__(self, user_dir):
+        self.user_dir = Path(user_dir)
+        self.user_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self._db = self._connect()
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS chats ("
+                "id TEXT PRIMARY KEY, title TEXT NOT NULL, created_at TEXT NOT NULL, updated_at TEXT NOT NULL, "
+                "message_count INTEGER NOT NULL DEFAULT 0, summary TEXT, summary_upto INTEGER NOT NULL DEFAULT 0)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE, seq INTEGER NOT NULL, "
+                "role TEXT NOT NULL, text TEXT NOT NULL, code TEXT, segments TEXT, PRIMARY KEY (chat_id, seq))"
+            )
+            if "segments" not in {row[1] for row in self.db.execute("PRAGMA table_info(messages)")}:
+                # Rows written before structured segments keep their legacy code column
+                self.db.execute("ALTER TABLE messages ADD COLUMN segments TEXT")
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(chats)")}
+            if "message_count" not in columns:
+                # Stores created before the manifest columns existed
+                self.db.execute("ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+                self.db.execute(
+                    "UPDATE chats SET message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id)"
+                )
+            if "summary" not in columns:
+                self.db.execute("ALTER TABLE chats ADD COLUMN summary TEXT")
+                self.db.execute("ALTER TABLE chats ADD COLUMN summary_upto INTEGER NOT NULL DEFAULT 0")
+            self.db.execute("CREATE INDEX IF NOT EXISTS chats_updated_at ON chats(updated_at)")
+            self.full_text = self._create_search_index()
+        self.migrate_json_files()
+
+    def _connect(self):
+        db = sqlite3.connect(str(self.user_dir / DB_FILENAME), check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def db(self):
+        """The SQLite connection, reopened if the store was closed. Use under self.lock."""
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def close(self):
+        """Close the connection once no thread is using it; later calls reopen it."""
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _create_search_index(self):
+        """Create the FTS5 index over message text, kept in sync by triggers.
+
+        Returns False when SQLite was built without FTS5; search then falls
+        back to a LIKE scan.
+        """
+        exists = self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        try:
+            # External-content table: the index stores terms only and reads text back from messages
+            self.db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                "text, content='messages', content_rowid='rowid', tokenize=\"unicode61 tokenchars '_'\")"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self.db.execute(
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text); END"
+        )
+        self.db.execute(
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text); END"
+        )
+        if not exists:
+            # Index messages stored before search existed
+            self.db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        return True
+
+    def create_chat(self, first_query, chat_id=None, timestamp=None):
+        """Create an empty chat titled after its first query and return its ID."""
+        chat_id = chat_id or uuid.uuid4().hex
+        timestamp = timestamp or now_timestamp()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO chats (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, first_query[:TITLE_LENGTH], timestamp, timestamp),
+            )
+        return chat_id
+
+    def append_message(self, chat_id, message, timestamp=None):
+        """Append a single message (a dict with role, text and segments) to a chat."""
+        with self.lock, self.db:
+            self._insert_message(chat_id, message, timestamp or now_timestamp())
+
+    def _insert_message(self, chat_id, message, timestamp):
+        self.db.execute(
+            "INSERT INTO messages (chat_id, seq, role, text, segments) "
+            "SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ?, ? FROM messages WHERE chat_id = ?",
+            (chat_id, message["role"], message["text"] or "", json.dumps(message["segments"]), chat_id),
+        )
+        self.db.execute(
+            "UPDATE chats SET updated_at = ?, message_count = message_count + 1 WHERE id = ?",
+            (timestamp, chat_id),
+        )
+
+    def load_messages(self, chat_id, offset=0, limit=-1):
+        """Return the messages of a chat in order as dicts with role, text and segments.
+
+        ``offset`` and ``limit`` select a range of chat positions; the
+        default returns every message.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT role, text, code, segments FROM messages WHERE chat_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (chat_id, offset, limit),
+            ).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    @staticmethod
+    def _row_to_message(row):
+        role, text, code, segments = row
+        if segments is None:
+            return normalize_message((role, text, code))
+        return {"role": role, "text": text, "segments": json.loads(segments)}
+
+    def list_chats(self, limit=-1, offset=0):
+        """Return manifest entries (id, title, timestamp, message_count), newest first.
+
+        ``limit`` and ``offset`` select a page; the default returns every chat.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, title, updated_at, message_count FROM chats "
+                "ORDER BY updated_at DESC, rowid DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [
+            {"id": chat_id, "title": title, "timestamp": timestamp, "message_count": count}
+            for chat_id, title, timestamp, count in rows
+        ]
+
+    def search(self, query, limit=20):
+        """Return the chats matching query, best match first.
+
+        Each result has id, title, timestamp and a snippet of the best
+        matching message with the matched terms in **bold**. Every word of
+        the query must match; the last one also matches as a prefix so
+        results update while the user is typing.
+        """
+        terms = _SEARCH_TERMS.findall(query)
+        if not terms:
+            return []
+        with self.lock:
+            if self.full_text:
+                match = " ".join('"%s"' % term for term in terms) + "*"
+                # Several messages of one chat can match; fetch extra rows and keep the best per chat
+                rows = self.db.execute(
+                    "SELECT m.chat_id, c.title, c.updated_at, "
+                    "snippet(messages_fts, 0, '**', '**', '…', ?) "
+                    "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                    "JOIN chats c ON c.id = m.chat_id "
+                    "WHERE messages_fts MATCH ? ORDER BY messages_fts.rank LIMIT ?",
+                    (SNIPPET_WORDS, match, limit * 5),
+                ).fetchall()
+            else:
+                pattern = "%" + "%".join(term.replace("%", "").replace("_", "\\_") for term in terms) + "%"
+                rows = self.db.execute(
+                    "SELECT m.chat_id, c.title, c.updated_at, substr(m.text, 1, 200) "
+                    "FROM messages m JOIN chats c ON c.id = m.chat_id "
+                    "WHERE m.text LIKE ? ESCAPE '\\' ORDER BY c.updated_at DESC LIMIT ?",
+                    (pattern, limit * 5),
+                ).fetchall()
+        results = {}
+        for chat_id, title, timestamp, snippet in rows:
+            if chat_id not in results and len(results) < limit:
+                results[chat_id] = {"id": chat_id, "title": title, "timestamp": timestamp, "snippet": snippet}
+        return list(results.values())
+
+    def iter_chats(self, batch_size=100):
+        """Yield every chat's full manifest row (id, title, created_at, updated_at, summary, summary_upto).
+
+        Rows are read in batches, so iterating a large store keeps only one
+        batch in memory and does not hold the lock between batches.
+        """
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT rowid, id, title, created_at, updated_at, summary, summary_upto FROM chats "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+            for row in rows:
+                yield dict(zip(("id", "title", "created_at", "updated_at", "summary", "summary_upto"), row[1:]))
+            if len(rows) < batch_size:
+                return
+            last_rowid = rows[-1][0]
+
+    def import_chat(self, chat, messages):
+        """Insert a chat with its original ID and timestamps. Returns False if the ID already exists."""
+        with self.lock, self.db:
+            if self.db.execute("SELECT 1 FROM chats WHERE id = ?", (chat["id"],)).fetchone():
+                return False
+            self.db.execute(
+                "INSERT INTO chats (id, title, created_at, updated_at, summary, summary_upto) VALUES (?, ?, ?, ?, ?, ?)",
+                (chat["id"], chat["title"][:TITLE_LENGTH], chat["created_at"], chat["updated_at"],
+                 chat.get("summary"), chat.get("summary_upto") or 0),
+            )
+            for message in messages:
+                self._insert_message(chat["id"], message, chat["updated_at"])
+        return True
+
+    def save_summary(self, chat_id, summary, summary_upto):
+        """Store the rolling summary covering the first summary_upto messages of a chat."""
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE chats SET summary = ?, summary_upto = ? WHERE id = ? AND summary_upto <= ?",
+                (summary, summary_upto, chat_id, summary_upto),
+            )
+
+    def load_summary(self, chat_id):
+        """Return (summary, summary_upto) for a chat; (None, 0) when it has no summary."""
+        with self.lock:
+            row = self.db.execute("SELECT summary, summary_upto FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return tuple(row) if row else (None, 0)
+
+    def count_chats(self):
+        """Return the number of chats in the manifest."""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def delete_chat(self, chat_id):
+        """Delete a chat and its messages. Returns False if it did not exist."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            deleted = self.db.execute("DELETE FROM chats WHERE id = ?", (chat_id,)).rowcount
+        return deleted > 0
+
+    def migrate_json_files(self):
+        """Import legacy <title>.json chat files and rename them to *.json.migrated."""
+        with self.lock:
+            for filepath in sorted(self.user_dir.glob("*.json")):
+                try:
+                    with open(filepath, "r", encoding="utf-8") as f:
+                        chat_data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+                timestamp = chat_data.get("timestamp") or now_timestamp()
+                with self.db:
+                    chat_id = uuid.uuid4().hex
+                    self.db.execute(
+                        "INSERT INTO chats (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                        (chat_id, chat_data.get("first_query", filepath.stem)[:TITLE_LENGTH], timestamp, timestamp),
+                    )
+                    for message in chat_data.get("messages", []):
+                        self._insert_message(chat_id, normalize_message(message), timestamp)
+                os.replace(filepath, filepath.with_name(filepath.name + ".migrated"))
@@ -1,89 +1,789 @@
-import groq
+import argparse
+import json
 import re
+import sys
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import os
+from response_cache import ResponseCache, make_cache_key
+from chat_log import get_log_writer
+from message_parser import normalize_message
+from singleflight import SingleFlight
+import metrics
+from rate_limit import (REQUEST_DEADLINE, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, call_with_retry, configure_rate_limiter,
+                        get_rate_limiter)
+from tokens import (MAX_TOKENS_POLICY, MESSAGE_OVERHEAD, MIN_COMPLETION_TOKENS, choose_max_tokens, classify_query,
+                    context_window, count_message_tokens, estimate_tokens)
 
 # Load environment variables
 load_dotenv()
 
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 
-# Initialize Groq client
-client = groq.Client(api_key=GROQ_API_KEY)
+_client = None
+_client_lock = threading.Lock()
 
 # Model name
 MODEL_NAME = "qwen-qwq-32b"
 
+# Model tiers picked by route_model; set GYAN_ROUTING=0 to send everything to MODEL_NAME
+MODEL_TIERS = {
+    "fast": os.getenv("GYAN_MODEL_FAST", "llama-3.1-8b-instant"),
+    "strong": os.getenv("GYAN_MODEL_STRONG", MODEL_NAME),
+}
+ROUTING_ENABLED = os.getenv("GYAN_ROUTING", "1") != "0"
+
+# Start a hedge request when the first visible token takes longer than this many seconds (0 disables hedging)
+HEDGE_AFTER = float(os.getenv("GYAN_HEDGE_AFTER", "0"))
+
+# Model used for hedge requests; defaults to the fast tier
+HEDGE_MODEL = os.getenv("GYAN_HEDGE_MODEL", MODEL_TIERS["fast"])
+
+_COMPLEX_HINTS = re.compile(
+    r"\b(design|architect\w*|optimi[sz]\w*|debug\w*|why|concurren\w*|algorithm\w*|complexity|refactor\w*|"
+    r"compare|trade-?offs?|step by step|scal(e|ing|able)|security|memory leak|race condition|deadlock)\b",
+    re.I,
+)
+
 # System message with instruction to prioritize language or default to Python
-chat_history = [
-    {
-        "role": "system",
-        "content": (
-            "You are a helpful coding assistant. Your sole purpose is to assist with programming and software development tasks. "
-            "Only answer questions that are directly related to coding, software engineering, or technical implementation. "
-            "If a user asks something unrelated to programming, politely respond that you can only help with coding questions. "
-            "When the user does not specify a programming language, respond using Python by default."
-        )
-    }
-]
+SYSTEM_PROMPT = (
+    "You are a helpful coding assistant. Your sole purpose is to assist with programming and software development tasks. "
+    "Only answer questions that are directly related to coding, software engineering, or technical implementation. "
+    "If a user asks something unrelated to programming, politely respond that you can only help with coding questions. "
+    "When the user does not specify a programming language, respond using Python by default."
+)
+
+# Token budget for the conversation sent with each request (system prompt included)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("GYAN_CONTEXT_TOKENS", "6000"))
+
+
+# Once the turns in a context exceed this many tokens, older turns are summarized
+SUMMARY_THRESHOLD = int(os.getenv("GYAN_SUMMARY_THRESHOLD", "3000"))
+
+# Number of most recent turns always kept verbatim
+SUMMARY_KEEP_TURNS = int(os.getenv("GYAN_SUMMARY_KEEP_TURNS", "6"))
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and a coding assistant so it can replace the original "
+    "messages. Keep the user's goals, the languages, libraries, file and function names involved, decisions "
+    "made, code that was agreed on, and any open questions. Be concise and do not add new advice."
+)
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summarizer")
+
+
+class ConversationContext:
+    """Per-session conversation sent to the model.
+
+    The system prompt is always kept. When the turns grow past
+    SUMMARY_THRESHOLD tokens, the older ones are folded into a rolling
+    summary in the background while the most recent turns stay verbatim;
+    anything that still does not fit the token budget is dropped.
+
+    Turns are numbered by their position in the chat, so ``summary_upto``
+    (the number of chat messages covered by the summary) can be stored
+    with the chat through ``summary_store`` and reused when it is resumed.
+    """
+
+    def __init__(self, system_prompt=SYSTEM_PROMPT, token_budget=CONTEXT_TOKEN_BUDGET,
+                 summary=None, summary_upto=0):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.token_budget = token_budget
+        self.summary = summary
+        self.summary_upto = summary_upto
+        self.turns = []
+        self.turn_offset = summary_upto  # Chat position of turns[0]
+        self.chat_id = None
+        self.summary_store = None
+        self._summarizing = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_messages(cls, messages, **kwargs):
+        """Rebuild a context from stored chat messages, skipping those already summarized."""
+        context = cls(**kwargs)
+        for message in messages[context.summary_upto:]:
+            message = normalize_message(message)
+            context.add(message["role"], message["text"])
+        return context
+
+    def to_state(self):
+        """Return a JSON-serializable snapshot of the turns and summary, e.g. for the shared state backend."""
+        with self._lock:
+            return {"chat_id": self.chat_id, "summary": self.summary, "summary_upto": self.summary_upto,
+                    "turn_offset": self.turn_offset, "turns": [dict(turn) for turn in self.turns]}
+
+    @classmethod
+    def from_state(cls, state, **kwargs):
+        """Rebuild a context from a to_state() snapshot."""
+        context = cls(summary=state["summary"], summary_upto=state["summary_upto"], **kwargs)
+        context.turns = [dict(turn) for turn in state["turns"]]
+        context.turn_offset = state["turn_offset"]
+        context.chat_id = state["chat_id"]
+        return context
+
+    def add(self, role, content):
+        """Append a turn and trim the oldest turns that no longer fit the budget."""
+        with self._lock:
+            self.turns.append({"role": role, "content": content})
+            self.trim()
+
+    def _summary_message(self):
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}
+
+    def prompt_tokens(self):
+        """Estimate the prompt tokens of the messages that would be sent now."""
+        return count_message_tokens(self.messages())
+
+    def trim(self, token_budget=None):
+        """Drop the oldest turns until the conversation fits the token budget.
+
+        ``token_budget`` overrides the context's own budget, e.g. to make
+        room for a larger completion.
+        """
+        with self._lock:
+            budget = (token_budget or self.token_budget) - count_message_tokens([self.system_message])
+            if self.summary:
+                budget -= count_message_tokens([self._summary_message()])
+            used = 0
+            keep = 0
+            for turn in reversed(self.turns):
+                cost = MESSAGE_OVERHEAD + estimate_tokens(turn["content"])
+                if used + cost > budget and keep:
+                    break
+                used += cost
+                keep += 1
+            dropped = len(self.turns) - keep
+            del self.turns[:dropped]
+            self.turn_offset += dropped
+
+    def messages(self):
+        """Return the message list to send to the model."""
+        with self._lock:
+            summary_message = self._summary_message()
+            return [self.system_message] + ([summary_message] if summary_message else []) + self.turns
+
+    def maybe_summarize(self, engine=None):
+        """Fold older turns into the summary in the background once they exceed the threshold."""
+        with self._lock:
+            if self._summarizing or len(self.turns) <= SUMMARY_KEEP_TURNS:
+                return None
+            if sum(estimate_tokens(turn["content"]) for turn in self.turns) <= SUMMARY_THRESHOLD:
+                return None
+            folded = self.turns[:len(self.turns) - SUMMARY_KEEP_TURNS]
+            upto = self.turn_offset + len(folded)
+            self._summarizing = True
+            return _summary_executor.submit(self._summarize, self.summary, folded, upto, engine)
+
+    def _summarize(self, previous_summary, folded, upto, engine):
+        try:
+            summary = summarize_turns(previous_summary, folded, engine)
+            with self._lock:
+                self.summary = summary
+                self.summary_upto = upto
+                dropped = max(0, min(len(self.turns), upto - self.turn_offset))
+                del self.turns[:dropped]
+                self.turn_offset += dropped
+                chat_id, summary_store = self.chat_id, self.summary_store
+            if summary_store is not None and chat_id is not None:
+                summary_store.save_summary(chat_id, summary, upto)
+            return summary
+        finally:
+            self._summarizing = False
+
+    def clear(self):
+        with self._lock:
+            self.turn_offset += len(self.turns)
+            self.turns = []
+
+
+# Answers to repeated questions are served from a cache; set GYAN_RESPONSE_CACHE=0 to disable
+RESPONSE_CACHE_ENABLED = os.getenv("GYAN_RESPONSE_CACHE", "1") != "0"
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+# Share one upstream call between identical requests that are in flight at the same time; 0 disables it
+COALESCE_ENABLED = os.getenv("GYAN_COALESCE", "1") != "0"
+
+_flights = SingleFlight()
+
+
+def get_response_cache():
+    """Returns the process-wide response cache, creating it on first use."""
+    global _response_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
+
 
+def lookup_cached_reply(user_query, context, model=MODEL_NAME):
+    """Returns (cache_key, cached_reply) for user_query in the given context.
 
-# File to store conversation history
-LOG_FILE = "chat_history.txt"
+    The key covers the model and the conversation so far, so a follow-up
+    question only hits the cache when it follows the same conversation.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return None, None
+    key = make_cache_key(user_query, context.messages(), model)
+    return key, cache.get(key)
 
 
-def log_conversation(user_query, assistant_reply):
-    """Logs user query and assistant response to a file with separators."""
-    with open(LOG_FILE, "a", encoding="utf-8") as file:
-        file.write(f"👤 User: {user_query}\n")
-        file.write(f"🤖 Bot: {assistant_reply}\n")
-        file.write("-----\n")  # Add separator for clarity
+def flight_key(user_query, context, model, cache_key=None):
+    """Returns the key identical in-flight requests are coalesced on, or None when coalescing is off."""
+    if not COALESCE_ENABLED:
+        return None
+    return cache_key or make_cache_key(user_query, context.messages(), model)
+
+
+def store_cached_reply(cache_key, assistant_reply):
+    cache = get_response_cache()
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, assistant_reply)
+
+
+def log_conversation(user_query, assistant_reply, **fields):
+    """Queues a structured log record for the query and assistant response.
+
+    Extra fields (user, chat_id, latency_ms, token counts, ...) are stored
+    alongside; the record is written by the background log writer.
+    """
+    record = {"time": time.time(), "query": user_query, "reply": assistant_reply}
+    record.update(fields)
+    get_log_writer().write(record)
+
+
+def usage_tokens(response):
+    """Returns (prompt_tokens, completion_tokens) reported for a response or stream chunk."""
+    usage = getattr(response, "usage", None) or getattr(getattr(response, "x_groq", None), "usage", None)
+    if usage is None:
+        return None, None
+    return usage.prompt_tokens, usage.completion_tokens
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def record_metrics(outcome, started, prompt_tokens=None, completion_tokens=None, generation_seconds=None,
+                   error=None):
+    """Records request counters, latency and token throughput."""
+    metrics.REQUESTS.inc(outcome=outcome)
+    metrics.LATENCY_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+    if error is not None:
+        metrics.ERRORS.inc(type=type(error).__name__)
+    if prompt_tokens:
+        metrics.PROMPT_TOKENS.inc(prompt_tokens)
+    if completion_tokens:
+        metrics.COMPLETION_TOKENS.inc(completion_tokens)
+        if generation_seconds:
+            metrics.TOKENS_PER_SECOND.observe(completion_tokens / generation_seconds)
+
+
+_THINK_BLOCK = re.compile(r'<think>.*?</think>', re.DOTALL)
+_BLANK_LINES = re.compile(r'\n\s*\n')
 
 
 def clean_response(text):
     """Remove <think> tags and their content from the response."""
-    # Pattern to match <think> tags and everything between them
-    pattern = r'<think>.*?</think>'
-    # Remove the matched patterns
-    cleaned_text = re.sub(pattern, '', text, flags=re.DOTALL)
+    # Remove <think> tags and everything between them
+    cleaned_text = _THINK_BLOCK.sub('', text)
     # Remove any extra whitespace that might result from the removal
-    cleaned_text = re.sub(r'\n\s*\n', '\n\n', cleaned_text.strip())
+    cleaned_text = _BLANK_LINES.sub('\n\n', cleaned_text.strip())
     return cleaned_text
 
 
-def get_coding_response(user_query):
-    """Sends user query to Groq API and returns the response."""
-    chat_history.append({"role": "user", "content": user_query})
+class ThinkFilter:
+    """Incrementally removes <think>...</think> spans from a stream of chunks.
+
+    Tags may be split across chunk boundaries, so a partial tag at the end of
+    a chunk is held back until the next chunk arrives.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.inside = False
+        self.pending = ""
+        self.started = False
+
+    @staticmethod
+    def _partial_tag_length(text, tag):
+        """Length of the longest suffix of text that is a prefix of tag."""
+        for size in range(min(len(text), len(tag) - 1), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def _emit(self, text):
+        # Drop leading whitespace left behind by a removed <think> block
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def feed(self, chunk):
+        """Consume a chunk and return the text that can be shown right away."""
+        buffer = self.pending + chunk
+        visible = []
+        while buffer:
+            if self.inside:
+                end = buffer.find(self.CLOSE_TAG)
+                if end < 0:
+                    keep = self._partial_tag_length(buffer, self.CLOSE_TAG)
+                    buffer = buffer[len(buffer) - keep:]
+                    break
+                buffer = buffer[end + len(self.CLOSE_TAG):]
+                self.inside = False
+            else:
+                start = buffer.find(self.OPEN_TAG)
+                if start < 0:
+                    keep = self._partial_tag_length(buffer, self.OPEN_TAG)
+                    visible.append(buffer[:len(buffer) - keep])
+                    buffer = buffer[len(buffer) - keep:]
+                    break
+                visible.append(buffer[:start])
+                buffer = buffer[start + len(self.OPEN_TAG):]
+                self.inside = True
+        self.pending = buffer
+        return self._emit("".join(visible))
+
+    def flush(self):
+        """Return any text held back at the end of the stream."""
+        remaining = "" if self.inside else self.pending
+        self.pending = ""
+        return self._emit(remaining)
+
+
+def route_model(user_query, context=None):
+    """Picks a model tier for the query from cheap features.
+
+    Short questions without code, complexity hints or a long conversation
+    behind them go to the fast tier; everything else to the strong tier.
+    """
+    if not ROUTING_ENABLED:
+        return MODEL_NAME
+    has_code = "```" in user_query or user_query.count("\n") >= 3
+    complex_query = _COMPLEX_HINTS.search(user_query) is not None
+    long_query = estimate_tokens(user_query) > 60
+    long_conversation = context is not None and len(context.turns) > 4
+    if has_code or complex_query or long_query or long_conversation:
+        return MODEL_TIERS["strong"]
+    return MODEL_TIERS["fast"]
+
+
+def plan_request(user_query, context, model=MODEL_NAME):
+    """Returns the messages to send and a max_tokens sized to the query and the free context window."""
+    max_tokens = choose_max_tokens(context.messages(), model, classify_query(user_query))
+    if max_tokens is None:
+        # The prompt nearly fills the context window; drop older turns to leave room for the answer
+        context.trim(context_window(model) - MAX_TOKENS_POLICY["default"])
+        max_tokens = choose_max_tokens(context.messages(), model) or MIN_COMPLETION_TOKENS
+    return context.messages(), max_tokens
+
+
+def get_client():
+    """Returns the synchronous Groq client, creating it on first use.
+
+    The SDK is imported here rather than at module level, so importing
+    this module stays cheap for pages that never call the model directly.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import groq
+
+            _client = groq.Client(api_key=GROQ_API_KEY)
+    return _client
+
+
+def _send_completion(engine, params):
+    if engine is None:
+        return get_client().chat.completions.create(**params)
+    params = dict(params)
+    if params.pop("stream", False):
+        return engine.stream(**params)
+    return engine.submit(**params).result()
+
+
+class CompletionStream:
+    """Iterator over the chunks of a streaming completion.
+
+    close() stops the upstream request and may be called from any
+    thread; the reading thread then sees the stream end.
+    """
+
+    def __init__(self, chunks, close):
+        self.chunks = chunks
+        self._close = close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
 
+    def close(self):
+        self._close()
+
+    def __del__(self):
+        self.close()
+
+
+def _closer(response):
+    return getattr(response, "close", None) or (lambda: None)
+
+
+def create_completion(engine=None, on_stream=None, **params):
+    """Runs a chat completion, through the shared LLMEngine when one is given.
+
+    Requests wait for the client-side rate limiter, and rate-limit or
+    transient errors are retried with backoff until REQUEST_DEADLINE.
+    With ``stream=True`` a CompletionStream is returned; the first chunk
+    is fetched before returning so a failed stream is retried too.
+    ``on_stream`` is called with each upstream stream as soon as it is
+    opened, so another thread can close it while the first chunk is
+    still pending.
+    """
+    limiter = get_rate_limiter()
+    deadline = time.monotonic() + REQUEST_DEADLINE
+
+    def attempt():
+        limiter.acquire(count_message_tokens(params["messages"]), deadline)
+        response = _send_completion(engine, params)
+        if not params.get("stream"):
+            return response
+        if on_stream is not None:
+            on_stream(response)
+        chunks = iter(response)
+        first_chunk = next(chunks, None)
+        if first_chunk is not None:
+            chunks = itertools.chain([first_chunk], chunks)
+        return CompletionStream(chunks, _closer(response))
+
+    return call_with_retry(attempt, deadline, limiter)
+
+
+_STREAM_DONE = object()
+
+
+def hedged_stream(engine, params, hedge_params, hedge_after):
+    """Streams params, racing a hedge request if no visible token arrives within hedge_after seconds.
+
+    Whichever request produces visible (non-<think>) text first wins and is
+    streamed to the caller, including the chunks it buffered so far; the
+    other one is closed, which frees its engine slot, and the tokens it
+    generated are charged to the rate limiter. A request that fails is
+    ignored while the other is still running. Returns a CompletionStream;
+    closing it stops both requests.
+    """
+    events = queue.Queue()
+    winner = []
+    stopped = []
+    streams = {}
+    streams_lock = threading.Lock()
+
+    def opened(name, stream):
+        with streams_lock:
+            streams[name] = stream
+            lost = stopped or (winner and winner[0] != name)
+        if lost:
+            stream.close()
+
+    def run(name, attempt_params):
+        detector = ThinkFilter()
+        received = []
+        try:
+            for chunk in create_completion(engine, on_stream=lambda stream: opened(name, stream), **attempt_params):
+                if winner and winner[0] != name:
+                    return
+                content = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+                received.append(content)
+                events.put((name, chunk, bool(detector.feed(content))))
+            events.put((name, _STREAM_DONE, True))
+        except Exception as e:
+            events.put((name, e, False))
+        finally:
+            if winner and winner[0] != name:
+                charge_completion_tokens(estimate_tokens("".join(received)))
+
+    def close_streams(keep=None):
+        with streams_lock:
+            losers = [stream for name, stream in streams.items() if name != keep]
+        for stream in losers:
+            stream.close()
+
+    def stop():
+        with streams_lock:
+            stopped.append(True)
+        close_streams()
+
+    def race():
+        running = {"primary"}
+        buffered = {"primary": [], "hedge": []}
+        hedge_at = time.monotonic() + hedge_after
+        try:
+            while True:
+                timeout = None if winner or hedge_at == float("inf") else max(0.0, hedge_at - time.monotonic())
+                try:
+                    name, item, visible = events.get(timeout=timeout)
+                except queue.Empty:
+                    if stopped:
+                        return
+                    running.add("hedge")
+                    hedge_at = float("inf")
+                    metrics.HEDGES.inc(event="started")
+                    threading.Thread(target=run, args=("hedge", hedge_params), daemon=True).start()
+                    continue
+
+                if winner and name != winner[0]:
+                    continue
+                if isinstance(item, Exception):
+                    running.discard(name)
+                    if winner or not running:
+                        raise item
+                    continue
+                if not winner:
+                    if not visible:
+                        buffered[name].append(item)
+                        continue
+                    winner.append(name)
+                    if hedge_at == float("inf"):
+                        metrics.HEDGES.inc(event=f"won_{name}")
+                        close_streams(keep=name)
+                    yield from buffered[name]
+                if item is _STREAM_DONE:
+                    return
+                yield item
+        finally:
+            # Also stops the winner when the caller leaves before the end
+            stop()
+
+    threading.Thread(target=run, args=("primary", params), daemon=True).start()
+    return CompletionStream(race(), stop)
+
+
+def open_stream(engine, params, hedge_params=None):
+    """Opens a streaming completion, hedged when HEDGE_AFTER is set and the hedge uses another model."""
+    if HEDGE_AFTER > 0 and hedge_params is not None and hedge_params["model"] != params["model"]:
+        return hedged_stream(engine, params, hedge_params, HEDGE_AFTER)
+    return create_completion(engine, **params)
+
+
+def open_shared_stream(key, engine, params, hedge_params=None):
+    """Opens a streaming completion, attaching to an identical one already in flight.
+
+    Returns (chunks, shared); shared is True when another request's stream
+    is being replayed, so its tokens must not be counted again.
+    """
+    if key is None:
+        return open_stream(engine, params, hedge_params), False
+    return _flights.stream(key, lambda: open_stream(engine, params, hedge_params))
+
+
+def shared_completion(key, engine, **params):
+    """Runs a completion, or waits for an identical one already in flight. Returns (response, shared)."""
+    if key is None:
+        return create_completion(engine, **params), False
+    return _flights.do(key, lambda: create_completion(engine, **params))
+
+
+def charge_completion_tokens(completion_tokens):
+    """Counts generated tokens against the tokens-per-minute limit once they are known."""
+    get_rate_limiter().charge(completion_tokens)
+
+
+def stream_coding_response(user_query, context=None, engine=None, log_fields=None):
+    """Streams the model response to user_query, yielding visible text chunks.
+
+    <think> blocks are removed as they arrive. Once the stream is finished
+    the cleaned reply is added to the context and logged together with
+    ``log_fields`` (e.g. user and chat_id).
+    """
+    started = time.perf_counter()
+    if context is None:
+        context = ConversationContext()
+    model = route_model(user_query, context)
+    log_fields = dict(log_fields or {}, model=model)
+    cache_key, cached_reply = lookup_cached_reply(user_query, context, model)
+    coalesce_key = flight_key(user_query, context, model, cache_key) if cached_reply is None else None
+    context.add("user", user_query)
+
+    if cached_reply is not None:
+        context.add("assistant", cached_reply)
+        log_conversation(user_query, cached_reply, cached=True, latency_ms=elapsed_ms(started), **log_fields)
+        record_metrics("cached", started)
+        context.maybe_summarize(engine)
+        yield cached_reply
+        return
+
+    think_filter = ThinkFilter()
+    parts = []
+    prompt_tokens = completion_tokens = None
+    first_token_at = None
+    shared = False
+    stream = None
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=chat_history,
+        messages, max_tokens = plan_request(user_query, context, model)
+        params = dict(model=model, messages=messages, temperature=0.7, max_tokens=max_tokens, stream=True)
+        hedge_params = dict(params, model=HEDGE_MODEL,
+                            max_tokens=choose_max_tokens(messages, HEDGE_MODEL, classify_query(user_query)))
+        stream, shared = open_shared_stream(coalesce_key, engine, params,
+                                            hedge_params if hedge_params["max_tokens"] else None)
+        for chunk in stream:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                # A coalesced follower made no upstream call of its own
+                if not shared:
+                    metrics.TTFT_SECONDS.observe(first_token_at - started)
+            chunk_prompt_tokens, chunk_completion_tokens = usage_tokens(chunk)
+            if chunk_prompt_tokens is not None:
+                prompt_tokens, completion_tokens = chunk_prompt_tokens, chunk_completion_tokens
+            if not chunk.choices:
+                continue
+            visible = think_filter.feed(chunk.choices[0].delta.content or "")
+            if visible:
+                parts.append(visible)
+                yield visible
+        visible = think_filter.flush()
+        if visible:
+            parts.append(visible)
+            yield visible
+
+    except Exception as e:
+        error_message = f"Error: {str(e)}"
+        # The chat stores the error as the reply, so the context keeps a matching turn
+        context.add("assistant", error_message)
+        log_conversation(user_query, error_message, error=type(e).__name__,
+                         latency_ms=elapsed_ms(started), **log_fields)
+        record_metrics("error", started, error=e)
+        yield error_message
+        return
+    finally:
+        # Stops the upstream request, or detaches from a shared one, when the caller stops reading early
+        if stream is not None:
+            stream.close()
+
+    generation_seconds = time.perf_counter() - first_token_at if first_token_at else None
+    with metrics.timed(metrics.POSTPROCESS_SECONDS):
+        assistant_reply = clean_response("".join(parts))
+    context.add("assistant", assistant_reply)
+    if shared:
+        # The request that made the upstream call accounts for its tokens
+        log_conversation(user_query, assistant_reply, coalesced=True, latency_ms=elapsed_ms(started), **log_fields)
+        record_metrics("coalesced", started)
+    else:
+        charge_completion_tokens(completion_tokens or estimate_tokens("".join(parts)))
+        store_cached_reply(cache_key, assistant_reply)
+        log_conversation(user_query, assistant_reply, latency_ms=elapsed_ms(started), prompt_tokens=prompt_tokens,
+                         completion_tokens=completion_tokens, **log_fields)
+        record_metrics("ok", started, prompt_tokens, completion_tokens, generation_seconds)
+    context.maybe_summarize(engine)
+
+
+def summarize_turns(previous_summary, turns, engine=None):
+    """Asks the model for a summary of turns, continuing previous_summary if there is one."""
+    transcript = "\n\n".join(f"{turn['role'].upper()}: {turn['content']}" for turn in turns)
+    if previous_summary:
+        transcript = f"EARLIER SUMMARY: {previous_summary}\n\n{transcript}"
+    response = create_completion(
+        engine,
+        model=MODEL_TIERS["fast"] if ROUTING_ENABLED else MODEL_NAME,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ],
+        temperature=0.2,
+        max_tokens=2048,
+    )
+    return clean_response(response.choices[0].message.content)
+
+
+def get_coding_response(user_query, context=None, engine=None, log_fields=None):
+    """Sends user query to Groq API and returns the response.
+
+    ``context`` is the caller's ConversationContext; a fresh one is used when
+    it is not given, so separate callers never share history.
+    """
+    started = time.perf_counter()
+    if context is None:
+        context = ConversationContext()
+    model = route_model(user_query, context)
+    log_fields = dict(log_fields or {}, model=model)
+    cache_key, cached_reply = lookup_cached_reply(user_query, context, model)
+    coalesce_key = flight_key(user_query, context, model, cache_key) if cached_reply is None else None
+    context.add("user", user_query)
+
+    if cached_reply is not None:
+        context.add("assistant", cached_reply)
+        log_conversation(user_query, cached_reply, cached=True, latency_ms=elapsed_ms(started), **log_fields)
+        record_metrics("cached", started)
+        context.maybe_summarize(engine)
+        return cached_reply
+
+    try:
+        messages, max_tokens = plan_request(user_query, context, model)
+        response, shared = shared_completion(
+            coalesce_key,
+            engine,
+            model=model,
+            messages=messages,
             temperature=0.7,
-            max_tokens=4096,
+            max_tokens=max_tokens,
         )
         assistant_reply = response.choices[0].message.content.strip()
         
         # Clean the response to remove <think> tags and their content
-        assistant_reply = clean_response(assistant_reply)
+        with metrics.timed(metrics.POSTPROCESS_SECONDS):
+            assistant_reply = clean_response(assistant_reply)
         
-        chat_history.append({"role": "assistant", "content": assistant_reply})
+        context.add("assistant", assistant_reply)
+        context.maybe_summarize(engine)
 
-        # Log query and response to file
-        log_conversation(user_query, assistant_reply)
+        # Log query and response
+        if shared:
+            # The request that made the upstream call accounts for its tokens
+            log_conversation(user_query, assistant_reply, coalesced=True, latency_ms=elapsed_ms(started),
+                             **log_fields)
+            record_metrics("coalesced", started)
+            return assistant_reply
+        store_cached_reply(cache_key, assistant_reply)
+        prompt_tokens, completion_tokens = usage_tokens(response)
+        charge_completion_tokens(completion_tokens or estimate_tokens(assistant_reply))
+        log_conversation(user_query, assistant_reply, latency_ms=elapsed_ms(started), prompt_tokens=prompt_tokens,
+                         completion_tokens=completion_tokens, **log_fields)
+        record_metrics("ok", started, prompt_tokens, completion_tokens)
 
         return assistant_reply
 
     except Exception as e:
         error_message = f"Error: {str(e)}"
-        log_conversation(user_query, error_message)
+        # The chat stores the error as the reply, so the context keeps a matching turn
+        context.add("assistant", error_message)
+        log_conversation(user_query, error_message, error=type(e).__name__,
+                         latency_ms=elapsed_ms(started), **log_fields)
+        record_metrics("error", started, error=e)
         return error_message
 
 
-if __name__ == "__main__":
+def run_chat():
     print("💻 Coding Bot using Qwen2.5-Coder-32B (Groq API)")
     print("Type 'exit' to quit the conversation.\n")
 
+    context = ConversationContext()
+
     while True:
         user_query = input("👤 You: ")
 
@@ -91,5 +791,137 @@ if __name__ == "__main__":
             print("👋 Goodbye!")
             break
 
-        response = get_coding_response(user_query)
+        response = get_coding_response(user_query, context)
         print(f"🤖 Bot: {response}")
+
+
+def read_prompts(path):
+    """Yields (id, prompt) from a JSONL file of {"id": ..., "prompt": ...} records.
+
+    The id defaults to the line number; "query" is accepted for "prompt".
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get("id", line_number)), record.get("prompt") or record.get("query") or ""
+
+
+def completed_ids(path):
+    """Returns the ids answered successfully in an existing results file.
+
+    Makes sure the file ends with a newline, so a record cut short by a
+    crash is not merged with the next one appended.
+    """
+    done = set()
+    try:
+        with open(path, "rb+") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("ok"):
+                    done.add(str(record["id"]))
+            if file.tell():
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    file.write(b"\n")
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_batch(args):
+    """Answers every prompt in args.input concurrently and appends one JSON result per line to args.output.
+
+    Only prompts without a successful result in the output file are sent,
+    so an interrupted run picks up where it stopped when started again.
+    """
+    from llm_engine import LLMEngine
+
+    global RESPONSE_CACHE_ENABLED
+    # Cached answers would make the reported latencies meaningless, so batches ask the model unless told otherwise
+    RESPONSE_CACHE_ENABLED = RESPONSE_CACHE_ENABLED and args.cache
+    configure_rate_limiter(args.requests_per_minute, args.tokens_per_minute)
+    engine = LLMEngine(api_key=GROQ_API_KEY, max_concurrency=args.concurrency, max_queue=args.concurrency)
+    try:
+        return _run_batch(args, engine)
+    finally:
+        engine.close()
+
+
+def _run_batch(args, engine):
+    done = completed_ids(args.output) if args.resume else set()
+    prompts = [(prompt_id, prompt) for prompt_id, prompt in read_prompts(args.input) if prompt_id not in done]
+    print(f"{len(prompts)} prompts to run, {len(done)} already done", file=sys.stderr)
+
+    def answer(prompt_id, prompt):
+        started = time.perf_counter()
+        reply = get_coding_response(prompt, ConversationContext(), engine=engine,
+                                    log_fields={"batch": os.path.basename(args.input), "prompt_id": prompt_id})
+        return {"id": prompt_id, "prompt": prompt, "reply": reply, "ok": not reply.startswith("Error: "),
+                "latency_ms": elapsed_ms(started)}
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(answer, prompt_id, prompt) for prompt_id, prompt in prompts]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                # Each finished result is on disk before the next one, so a crash loses at most in-flight prompts
+                output.flush()
+                latencies.append(result["latency_ms"])
+                errors += not result["ok"]
+                if len(latencies) % 100 == 0:
+                    print(f"{len(latencies)}/{len(prompts)} done", file=sys.stderr)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"prompts: {len(latencies)}  errors: {errors}  elapsed: {elapsed:.1f}s  "
+          f"throughput: {len(latencies) / elapsed if elapsed else 0:.2f} prompts/s")
+    if latencies:
+        print(f"latency ms  p50: {percentile(latencies, 0.5)}  p95: {percentile(latencies, 0.95)}  "
+              f"p99: {percentile(latencies, 0.99)}  max: {latencies[-1]}")
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coding assistant on the command line.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("chat", help="interactive conversation (default)")
+    batch = commands.add_parser("batch", help="answer a JSONL file of prompts concurrently")
+    batch.add_argument("input", help='JSONL file with one {"id": ..., "prompt": ...} record per line')
+    batch.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    batch.add_argument("-c", "--concurrency", type=int, default=8, help="prompts in flight at once (default: %(default)s)")
+    batch.add_argument("--requests-per-minute", type=float, default=REQUESTS_PER_MINUTE,
+                       help="client-side request limit, 0 to disable (default: %(default)s)")
+    batch.add_argument("--tokens-per-minute", type=float, default=TOKENS_PER_MINUTE,
+                       help="client-side token limit, 0 to disable (default: %(default)s)")
+    batch.add_argument("--no-resume", dest="resume", action="store_false",
+                       help="overwrite the output instead of skipping prompts it already answers")
+    batch.add_argument("--cache", action="store_true",
+                       help="answer repeated prompts from the response cache (off by default, so latencies are real)")
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        return run_batch(args)
+    run_chat()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import threading
+import time
+
+import metrics
+
+# Maximum number of upstream calls running at the same time
+MAX_CONCURRENCY = int(os.getenv("GYAN_LLM_CONCURRENCY", "8"))
+
+# Maximum number of requests waiting for a free slot before new ones are rejected
+MAX_QUEUE = int(os.getenv("GYAN_LLM_QUEUE", "32"))
+
+# Seconds a request may wait in the queue before giving up
+QUEUE_TIMEOUT = float(os.getenv("GYAN_LLM_QUEUE_TIMEOUT", "30"))
+
+# Chunks a stream buffers ahead of its reader before the upstream read pauses
+STREAM_BUFFER = int(os.getenv("GYAN_LLM_STREAM_BUFFER", "64"))
+
+_STREAM_END = object()
+
+
+class EngineBusy(Exception):
+    """Raised when the engine cannot accept or schedule a request."""
+
+
+class EngineStream:
+    """Iterator over the chunks of a streaming completion running on the engine loop.
+
+    At most ``STREAM_BUFFER`` chunks are read ahead of the consumer.
+    close(), which may be called from any thread, cancels the upstream
+    call and frees its slot; it also runs when the iterator is garbage
+    collected, so a reader that stops early does not leave it running.
+    """
+
+    def __init__(self, engine, chunks, space, task):
+        self.engine = engine
+        self.chunks = chunks
+        self.space = space
+        self.task = task
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    async def _get(self):
+        item = await self.chunks.get()
+        self.space.release()
+        return item
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        item = asyncio.run_coroutine_threadsafe(self._get(), self.engine.loop).result()
+        if item is _STREAM_END:
+            self.finished = True
+            raise StopIteration
+        if isinstance(item, Exception):
+            self.finished = True
+            raise item
+        return item
+
+    def close(self):
+        """Stop the upstream call; chunks not yet read are discarded."""
+        if not self.task.done() and not self.engine.loop.is_closed():
+            self.engine.loop.call_soon_threadsafe(self.task.cancel)
+
+    def __del__(self):
+        self.close()
+
+
+class LLMEngine:
+    """Process-wide engine that runs model calls on a shared asyncio loop.
+
+    Calls are made with the async Groq client from a single background
+    thread, which caps the number of concurrent upstream calls and provides
+    admission control: at most ``max_concurrency`` calls run at once, up to
+    ``max_queue`` more wait for a slot and anything beyond that is rejected
+    with EngineBusy. Callers still block their own thread while they wait
+    for a result or read a stream.
+    """
+
+    def __init__(self, api_key=None, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE,
+                 queue_timeout=QUEUE_TIMEOUT, stream_buffer=STREAM_BUFFER):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.stream_buffer = stream_buffer
+        self.admitted = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-engine", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(api_key), self.loop).result()
+
+    async def _setup(self, api_key):
+        import groq
+
+        self.client = groq.AsyncGroq(api_key=api_key)
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+
+    def stats(self):
+        """Return the number of running and queued requests."""
+        with self._lock:
+            return {"running": self.running, "queued": self.admitted - self.running}
+
+    def _admit(self):
+        with self._lock:
+            if self.admitted >= self.max_concurrency + self.max_queue:
+                raise EngineBusy("The assistant is busy right now, please try again in a moment.")
+            self.admitted += 1
+
+    def _release(self):
+        with self._lock:
+            self.admitted -= 1
+
+    async def _acquire_slot(self):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise EngineBusy("Timed out waiting for the assistant, please try again.")
+        finally:
+            metrics.QUEUE_SECONDS.observe(time.perf_counter() - started)
+        with self._lock:
+            self.running += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self.running -= 1
+        self.slots.release()
+
+    async def _complete(self, params):
+        try:
+            await self._acquire_slot()
+            try:
+                return await self.client.chat.completions.create(**params)
+            finally:
+                self._release_slot()
+        finally:
+            self._release()
+
+    async def _stream(self, params, chunks, space):
+        try:
+            await self._acquire_slot()
+            try:
+                stream = await self.client.chat.completions.create(stream=True, **params)
+                try:
+                    async for chunk in stream:
+                        # Waits while the reader is STREAM_BUFFER chunks behind
+                        await space.acquire()
+                        chunks.put_nowait(chunk)
+                finally:
+                    await stream.close()
+            finally:
+                self._release_slot()
+        except Exception as e:
+            chunks.put_nowait(e)
+        finally:
+            self._release()
+            # Also sent when cancelled, so a reader still waiting wakes up
+            chunks.put_nowait(_STREAM_END)
+
+    async def _start_stream(self, params):
+        chunks = asyncio.Queue()
+        space = asyncio.Semaphore(self.stream_buffer)
+        return chunks, space, asyncio.ensure_future(self._stream(params, chunks, space))
+
+    def submit(self, **params):
+        """Schedule a completion and return a concurrent.futures.Future for it."""
+        self._admit()
+        return asyncio.run_coroutine_threadsafe(self._complete(params), self.loop)
+
+    def stream(self, **params):
+        """Schedule a streaming completion and return an EngineStream over its chunks.
+
+        Admission happens immediately, so EngineBusy is raised by this call
+        rather than by the first iteration.
+        """
+        self._admit()
+        try:
+            chunks, space, task = asyncio.run_coroutine_threadsafe(self._start_stream(params), self.loop).result()
+        except BaseException:
+            self._release()
+            raise
+        return EngineStream(self, chunks, space, task)
+
+    def close(self):
+        """Stop the event loop thread."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
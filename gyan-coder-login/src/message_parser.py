@@ -0,0 +1,100 @@
+FENCE = "```"
+
+# Language of the code kept in legacy (role, text, code) messages
+LEGACY_CODE_LANGUAGE = "python"
+
+
+class SegmentParser:
+    """Splits markdown into ordered text and fenced-code segments in one pass.
+
+    Text can be fed in arbitrary chunks (e.g. straight from a model stream);
+    each line is examined once, so parsing is linear in the response size.
+    A closing fence glued to the end of a code line and an unterminated
+    final block are both accepted.
+    """
+
+    def __init__(self):
+        self.segments = []
+        self.partial_line = ""
+        self.lines = []
+        self.in_code = False
+        self.language = None  # Language tag of the current code block, None when it has none
+
+    def feed(self, chunk):
+        lines = (self.partial_line + chunk).split("\n")
+        self.partial_line = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self):
+        """Finish parsing and return the list of segments."""
+        if self.partial_line:
+            self._line(self.partial_line)
+            self.partial_line = ""
+        self._finish_segment()
+        return self.segments
+
+    def _line(self, line):
+        stripped = line.strip()
+        if not self.in_code:
+            if stripped.startswith(FENCE):
+                self._finish_segment()
+                self.in_code = True
+                self.language = stripped[len(FENCE):].strip().split(" ")[0] or None
+            else:
+                self.lines.append(line)
+        elif stripped == FENCE:
+            self._finish_segment()
+        elif stripped.endswith(FENCE):
+            self.lines.append(line.rstrip()[:-len(FENCE)])
+            self._finish_segment()
+        else:
+            self.lines.append(line)
+
+    def _finish_segment(self):
+        if not self.in_code:
+            text = "\n".join(self.lines).strip()
+            if text:
+                self.segments.append({"type": "text", "text": text})
+        else:
+            code = "\n".join(self.lines).strip("\n")
+            if code.strip():
+                self.segments.append({"type": "code", "lang": self.language, "code": code})
+            self.in_code = False
+            self.language = None
+        self.lines = []
+
+
+def parse_segments(text):
+    """Split a full response into text and code segments."""
+    parser = SegmentParser()
+    parser.feed(text)
+    return parser.close()
+
+
+def segments_to_markdown(segments):
+    """Rebuild markdown from segments, e.g. to send a stored reply back to the model."""
+    parts = []
+    for segment in segments:
+        if segment["type"] == "code":
+            parts.append(f"{FENCE}{segment['lang'] or ''}\n{segment['code']}\n{FENCE}")
+        else:
+            parts.append(segment["text"])
+    return "\n\n".join(parts)
+
+
+def normalize_message(message):
+    """Return a stored message as a dict (or Message) with role, text and segments.
+
+    Accepts the current formats as well as legacy (role, text, code)
+    tuples, where code was the first python block cut out of the reply.
+    """
+    if not isinstance(message, (tuple, list)):
+        return message
+    role, text, code = message
+    segments = []
+    if text:
+        segments.append({"type": "text", "text": text})
+    if code:
+        segments.append({"type": "code", "lang": LEGACY_CODE_LANGUAGE, "code": code})
+    return {"role": role, "text": segments_to_markdown(segments), "segments": segments}
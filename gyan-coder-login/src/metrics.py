@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Port for the Prometheus text endpoint; the server is not started when unset
+METRICS_PORT = os.getenv("GYAN_METRICS_PORT")
+
+# Interface the endpoint listens on; set to 0.0.0.0 to let a scraper on another host reach it
+METRICS_HOST = os.getenv("GYAN_METRICS_HOST", "127.0.0.1")
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self.series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text, **kwargs):
+        return self._get(Histogram, name, help_text, **kwargs)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("gyan_llm_requests_total", "Model requests by outcome (ok, cached, coalesced, error).")
+ERRORS = REGISTRY.counter("gyan_llm_errors_total", "Model request errors by exception type.")
+PROMPT_TOKENS = REGISTRY.counter("gyan_llm_prompt_tokens_total", "Prompt tokens reported by the provider.")
+COMPLETION_TOKENS = REGISTRY.counter("gyan_llm_completion_tokens_total", "Completion tokens reported by the provider.")
+QUEUE_SECONDS = REGISTRY.histogram("gyan_llm_queue_seconds", "Time requests wait for an engine slot.")
+TTFT_SECONDS = REGISTRY.histogram("gyan_llm_ttft_seconds", "Time to first upstream token.")
+LATENCY_SECONDS = REGISTRY.histogram("gyan_llm_latency_seconds", "Total time to answer a query.")
+POSTPROCESS_SECONDS = REGISTRY.histogram("gyan_llm_postprocess_seconds", "Time spent cleaning a reply.")
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "gyan_llm_tokens_per_second", "Completion tokens per second of generation.",
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600),
+)
+HEDGES = REGISTRY.counter("gyan_llm_hedges_total", "Hedged streaming requests by event (started, won_primary, won_hedge).")
+FILE_IO_SECONDS = REGISTRY.histogram("gyan_file_io_seconds", "Time spent in chat and user storage operations.")
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the with-block in histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics on a background thread. Returns the server, or None when no port is set."""
+    if not port:
+        return None
+    # http.server is slow to import and only needed when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
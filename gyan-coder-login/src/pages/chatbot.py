@@ -1,9 +1,21 @@
 import streamlit as st
-from gyancoder import get_coding_response
-import json
-import os
-from datetime import datetime
+from gyancoder import stream_coding_response, ConversationContext, GROQ_API_KEY
+from llm_engine import LLMEngine
+from chat_store import get_chat_store
+from session_tokens import SESSION_TTL, issue_token, load_session, revoke_session, save_session, verify_token
+from state_backend import get_state_backend
+from message_parser import SegmentParser, normalize_message
+from transcript import Transcript
+import metrics
+from paths import user_chat_dir
+from archive import ArchiveError, export_archive, import_archive
+from assets import LOGO_SOURCE, LOGO_WIDTH, static_url, stylesheet, thumbnail
 from pathlib import Path
+import glob
+import html
+import os
+import tempfile
+import time
 
 # Initialize session state variables at the very beginning
 if 'authenticated' not in st.session_state:
@@ -11,13 +23,51 @@ if 'authenticated' not in st.session_state:
 if 'username' not in st.session_state:
     st.session_state['username'] = None
 if 'chat_history' not in st.session_state:
-    st.session_state['chat_history'] = []
+    st.session_state['chat_history'] = Transcript()
 if 'current_chat_id' not in st.session_state:
     st.session_state['current_chat_id'] = None
+if 'llm_context' not in st.session_state:
+    st.session_state['llm_context'] = ConversationContext.from_messages(st.session_state['chat_history'])
 if 'logout' not in st.session_state:
     st.session_state['logout'] = False
+if 'chat_page' not in st.session_state:
+    st.session_state['chat_page'] = 0
+
+# Number of previous chats listed per sidebar page
+CHATS_PER_PAGE = 20
+
+# Number of most recent messages rendered before "Load earlier messages"
+MESSAGE_WINDOW = 30
+
+# Seconds after which an export archive left behind by an ended session is deleted
+EXPORT_MAX_AGE = 3600
+
+# Show the per-session memory accounting in the sidebar (for sizing GYAN_SESSION_MEMORY_BYTES)
+SHOW_MEMORY_VIEW = os.getenv("GYAN_MEMORY_VIEW", "0") == "1"
+
+if 'message_window' not in st.session_state:
+    st.session_state['message_window'] = MESSAGE_WINDOW
+if 'rendered_messages' not in st.session_state:
+    st.session_state['rendered_messages'] = {}
 
 # Function definitions
+@st.cache_resource
+def get_llm_engine():
+    """Return the LLM engine shared by every session in this process."""
+    return LLMEngine(api_key=GROQ_API_KEY)
+
+@st.cache_resource
+def sidebar_logo():
+    """Return the resized sidebar logo, generated once per process; None when it is missing."""
+    if not Path(LOGO_SOURCE).exists():
+        return None
+    return thumbnail(LOGO_SOURCE, LOGO_WIDTH)
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Serve Prometheus metrics once per process when GYAN_METRICS_PORT is set."""
+    return metrics.start_metrics_server()
+
 def get_user_chat_dir():
     """Create and return the user's chat directory path."""
     if not st.session_state.get('username'):
@@ -25,75 +75,230 @@ def get_user_chat_dir():
         st.session_state['authenticated'] = False
         st.rerun()
     
-    base_dir = Path(__file__).parent.parent / "users_chat"
-    user_dir = base_dir / st.session_state['username']
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir
-
-def save_chat_history():
-    """Save current chat history to a JSON file."""
-    if not st.session_state.get('chat_history'):
-        return
-    
-    first_message = next((msg for msg in st.session_state['chat_history'] if msg[0] == "user"), None)
-    if not first_message:
-        return
-    
-    first_query = first_message[1][:50]  # Limit length
-    # Remove special characters and spaces, replace with underscores
-    safe_filename = "".join(c if c.isalnum() else "_" for c in first_query).strip("_")
-    filename = f"{safe_filename}.json"
-    
-    user_dir = get_user_chat_dir()
-    filepath = user_dir / filename
-    
-    chat_data = {
-        'first_query': first_query,
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'messages': st.session_state['chat_history']
-    }
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(chat_data, f, indent=2)
+    return Path(user_chat_dir(st.session_state['username']))
+
+def get_user_chat_store():
+    """Return the chat store for the logged-in user."""
+    return get_chat_store(get_user_chat_dir())
+
+def save_message(role, text, segments=None):
+    """Add a message to the session and append it to the current chat."""
+    message = {
+        'role': role,
+        'text': text,
+        'segments': segments if segments is not None else [{'type': 'text', 'text': text}]
+    }
+
+    store = get_user_chat_store()
+    if st.session_state['current_chat_id'] is None:
+        # The first user query names the chat
+        st.session_state['current_chat_id'] = store.create_chat(text)
+        # Lets the context store its rolling summary with the new chat
+        st.session_state['llm_context'].chat_id = st.session_state['current_chat_id']
+        st.session_state['llm_context'].summary_store = store
+        st.session_state['chat_history'].attach(st.session_state['current_chat_id'], store)
+        save_session_state()
+    with metrics.timed(metrics.FILE_IO_SECONDS, op="append_message"):
+        store.append_message(st.session_state['current_chat_id'], message)
+    # Saved first, so the transcript may drop it from memory later
+    st.session_state['chat_history'].append(message)
+
+def load_chat_histories(page=0):
+    """Load one page of the user's chat manifest, newest first.
+
+    Only titles and counts are read; messages are loaded when a chat is opened.
+    """
+    with metrics.timed(metrics.FILE_IO_SECONDS, op="list_chats"):
+        return get_user_chat_store().list_chats(limit=CHATS_PER_PAGE, offset=page * CHATS_PER_PAGE)
 
-def load_chat_histories():
-    """Load all available chat histories for the user."""
-    user_dir = get_user_chat_dir()
-    chat_files = []
-    
-    if user_dir.exists():
-        for filepath in user_dir.glob('*.json'):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                chat_data = json.load(f)
-                chat_files.append((filepath.name, chat_data))
-    
-    return sorted(chat_files, key=lambda x: x[0], reverse=True)
+def context_key(chat_id):
+    return f"{st.session_state['username']}:{chat_id}"
 
-def delete_chat_history(chat_file):
-    """Delete a specific chat history file."""
-    user_dir = get_user_chat_dir()
-    filepath = user_dir / chat_file
-    
-    if filepath.exists():
-        filepath.unlink() 
-        return True
-    return False
+def save_session_state():
+    """Record the current chat in the shared state backend so any replica can resume this session."""
+    if st.session_state.get('session_token'):
+        save_session(st.session_state['session_token'], username=st.session_state['username'],
+                     current_chat_id=st.session_state['current_chat_id'])
+
+def save_context_state():
+    """Store the model context of the current chat in the shared state backend."""
+    if st.session_state['current_chat_id'] is not None:
+        get_state_backend().set("contexts", context_key(st.session_state['current_chat_id']),
+                                st.session_state['llm_context'].to_state(), ttl=SESSION_TTL)
+
+def open_chat(chat_id):
+    """Load a chat's messages and make it the current chat.
+
+    The model context is taken from the shared state backend when it
+    matches the stored messages, otherwise rebuilt from them.
+    """
+    store = get_user_chat_store()
+    with metrics.timed(metrics.FILE_IO_SECONDS, op="load_messages"):
+        messages = store.load_messages(chat_id)
+        summary, summary_upto = store.load_summary(chat_id)
+    set_current_chat(messages, chat_id, summary, summary_upto)
+    state = get_state_backend().get("contexts", context_key(chat_id))
+    if state is not None and state['turn_offset'] + len(state['turns']) == len(messages):
+        context = ConversationContext.from_state(state)
+        context.summary_store = store
+        st.session_state['llm_context'] = context
+
+def search_chat_histories(query):
+    """Search the user's chats, best match first, with a snippet of the matching message."""
+    with metrics.timed(metrics.FILE_IO_SECONDS, op="search_chats"):
+        return get_user_chat_store().search(query, limit=CHATS_PER_PAGE)
+
+def delete_chat_history(chat_id):
+    """Delete a specific chat history."""
+    get_state_backend().delete("contexts", context_key(chat_id))
+    with metrics.timed(metrics.FILE_IO_SECONDS, op="delete_chat"):
+        return get_user_chat_store().delete_chat(chat_id)
+
+def remove_export():
+    """Delete the export archive prepared for this session, if any."""
+    path = st.session_state.pop('export_path', None)
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def remove_stale_exports():
+    """Delete export archives older than EXPORT_MAX_AGE, e.g. from sessions closed before downloading."""
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), "gyan-export-*.jsonl.gz")):
+        try:
+            if time.time() - os.path.getmtime(path) > EXPORT_MAX_AGE:
+                os.remove(path)
+        except OSError:
+            pass
+
+def export_user_archive():
+    """Write the user's chats to a temporary archive file and return its path.
 
-def get_response(user_query):
-    """Send user query to gyancoder.py and get model response."""
-    return get_coding_response(user_query)
+    The archive is streamed to disk rather than built in memory. It is
+    deleted once downloaded or on logout; the previous export of this
+    session and exports abandoned by other sessions are removed first.
+    """
+    remove_export()
+    remove_stale_exports()
+    fd, path = tempfile.mkstemp(prefix="gyan-export-", suffix=".jsonl.gz")
+    try:
+        with os.fdopen(fd, "wb") as file, metrics.timed(metrics.FILE_IO_SECONDS, op="export_archive"):
+            export_archive(get_user_chat_store(), file, username=st.session_state['username'])
+    except BaseException:
+        os.remove(path)
+        raise
+    st.session_state['export_path'] = path
+    return path
+
+def import_user_archive(uploaded_file):
+    """Import an uploaded archive into the user's chats. Returns the import counts."""
+    with metrics.timed(metrics.FILE_IO_SECONDS, op="import_archive"):
+        return import_archive(get_user_chat_store(), uploaded_file)
+
+def get_response(user_query, placeholder):
+    """Stream the model response into placeholder.
+
+    Returns the full text and its parsed segments; the response is parsed
+    as it streams, so no extra pass is needed afterwards.
+    """
+    response = ""
+    parser = SegmentParser()
+    chunks = stream_coding_response(
+        user_query,
+        st.session_state['llm_context'],
+        engine=get_llm_engine(),
+        log_fields={'user': st.session_state['username'], 'chat_id': st.session_state['current_chat_id']}
+    )
+    for chunk in chunks:
+        response += chunk
+        parser.feed(chunk)
+        # The first chunk replaces the "Thinking..." indicator
+        placeholder.markdown(response, unsafe_allow_html=False)
+    return response.strip(), parser.close()
+
+def set_current_chat(messages, chat_id, summary=None, summary_upto=0):
+    """Switch the session to the given chat and rebuild its model context.
+
+    A stored rolling summary replaces the messages it covers.
+    """
+    st.session_state['chat_history'] = Transcript(messages, chat_id, get_user_chat_store() if chat_id else None)
+    st.session_state['current_chat_id'] = chat_id
+    context = ConversationContext.from_messages(messages, summary=summary, summary_upto=summary_upto)
+    if chat_id is not None:
+        context.chat_id = chat_id
+        context.summary_store = get_user_chat_store()
+    st.session_state['llm_context'] = context
+    st.session_state['message_window'] = MESSAGE_WINDOW
+    st.session_state['rendered_messages'] = {}
+    save_session_state()
+
+def message_blocks(index):
+    """Return the render blocks for a message, cached by message ID for the session."""
+    message_id = f"{st.session_state['current_chat_id']}:{index}"
+    blocks = st.session_state['rendered_messages'].get(message_id)
+    if blocks is None:
+        message = normalize_message(st.session_state['chat_history'][index])
+        if message['role'] == "user":
+            blocks = [("html", f"<div class='user-message'>{html.escape(message['text'])}</div>", None)]
+        else:
+            blocks = [
+                ("code", segment['code'], segment['lang']) if segment['type'] == "code"
+                else ("markdown", segment['text'], None)
+                for segment in message['segments']
+            ]
+        st.session_state['rendered_messages'][message_id] = blocks
+    return blocks
+
+@st.fragment
+def chat_history_view():
+    """Render the most recent messages; older ones load on request.
+
+    Runs as a fragment, so "Load earlier messages" reruns only the history
+    rather than the whole page.
+    """
+    message_count = len(st.session_state['chat_history'])
+    first_shown = max(0, message_count - st.session_state['message_window'])
+    if first_shown:
+        if st.button(f"Load earlier messages ({first_shown} hidden)", key="load_earlier_messages"):
+            st.session_state['message_window'] += MESSAGE_WINDOW
+            st.rerun(scope="fragment")
+    # Keep render blocks only for the messages on screen
+    st.session_state['rendered_messages'] = {
+        message_id: blocks for message_id, blocks in st.session_state['rendered_messages'].items()
+        if int(message_id.rsplit(":", 1)[1]) >= first_shown
+    }
+    for index in range(first_shown, message_count):
+        render_blocks(message_blocks(index))
+
+def render_blocks(blocks):
+    for kind, body, language in blocks:
+        if kind == "html":
+            st.markdown(body, unsafe_allow_html=True)
+        elif kind == "code":
+            st.code(body, language=language)
+        else:
+            st.markdown(body, unsafe_allow_html=False)
 
 query_params = st.query_params
 
-if not st.session_state['authenticated'] and 'authenticated' in query_params and 'username' in query_params:
-    st.session_state['authenticated'] = query_params['authenticated'] == 'true'
-    st.session_state['username'] = query_params['username']
-    # Load last chat or initialize new one
-    chat_histories = load_chat_histories()
-    if chat_histories:
-        latest_chat = sorted(chat_histories, key=lambda x: x[1].get('timestamp', ''), reverse=True)[0]
-        st.session_state['chat_history'] = latest_chat[1]['messages']
-        st.session_state['current_chat_id'] = latest_chat[0]
+# Restore the session from a signed token on reloads and reconnects
+session_user = None
+if not st.session_state['authenticated'] and 'session' in query_params:
+    session_user = verify_token(query_params['session'])
+
+if session_user:
+    st.session_state['authenticated'] = True
+    st.session_state['username'] = session_user
+    st.session_state['session_token'] = query_params['session']
+    # Reopen the chat this session was on, possibly on another replica, or else the latest one
+    session_state = load_session(query_params['session']) or {}
+    if session_state.get('current_chat_id'):
+        open_chat(session_state['current_chat_id'])
+        if not st.session_state['chat_history']:
+            # The chat was deleted meanwhile
+            set_current_chat([], None)
+    else:
+        latest_chats = get_user_chat_store().list_chats(limit=1)
+        if latest_chats:
+            open_chat(latest_chats[0]['id'])
 
 # Check authentication
 if not st.session_state['authenticated']:
@@ -111,343 +316,47 @@ if st.session_state['authenticated'] and not st.session_state['username']:
     st.stop()
 
 # Update query parameters to persist session state
-st.query_params = {
-    "authenticated": str(st.session_state['authenticated']).lower(),
-    "username": st.session_state['username']
-}
+if not st.session_state.get('session_token'):
+    st.session_state['session_token'] = issue_token(st.session_state['username'])
+if query_params.get('session') != st.session_state['session_token']:
+    st.query_params = {"session": st.session_state['session_token']}
 
 # Set page config for chatbot
 st.set_page_config(page_title="Coding Chatbot", page_icon="🤖", layout="centered")
 
+start_metrics_endpoint()
+
 col1, col2 = st.columns([6, 1])
 with col1:
     st.title("🤖 Code Helper Bot")
 with col2:
     if st.button("New Chat", key="clear_chat_btn"):
-        if st.session_state['chat_history']:  
-            save_chat_history()
-        st.session_state['chat_history'] = []  
-        st.session_state['current_chat_id'] = None
+        set_current_chat([], None)
         st.rerun()
 
-st.markdown("""
-    <style>
-    /* Hide default Streamlit sidebar navigation */
-    div[data-testid="stSidebarNav"] {
-        display: none;
-    }
-    
-    /* Hide sidebar header with logo and collapse button */
-    div[data-testid="stSidebarHeader"] {
-        display: none !important;
-    }
-    
-    /* Remove space above first element in sidebar (coding image) */
-    section[data-testid="stSidebar"] > div:first-child > div:first-child {
-        margin-top: -25px !important;
-        padding-top: 0 !important;
-    }
-    
-    section[data-testid="stSidebar"] > div > div:first-child .element-container {
-        margin-top: 0 !important;
-        padding-top: 0 !important;
-    }
-    
-    /* More aggressive targeting of sidebar padding */
-    section[data-testid="stSidebar"] .block-container {
-        padding-top: 0 !important;
-    }
-    
-    section[data-testid="stSidebar"] img {
-        margin-top: 0 !important;
-        padding-top: 0 !important;
-    }
-    
-    /* Sidebar image container */
-    section[data-testid="stSidebar"] [data-testid="stImage"] {
-        margin-top: 0 !important;
-        padding-top: 0 !important;
-    }
-    
-    .user-message {
-        background-color: #DCF8C6;
-        border-radius: 12px;
-        padding: 10px 15px;
-        margin: 5px 0;
-        max-width: 70%;
-        float: right;
-        clear: both;
-        color: black;
-    }
-    .bot-message {
-        background-color: #F1F0F0;
-        border-radius: 12px;
-        padding: 10px 15px;
-        margin: 5px 0;
-        max-width: 70%;
-        float: left;
-        clear: both;
-        color: black;
-    }
-
-    /* Target only sidebar buttons using more specific selectors */
-    section[data-testid="stSidebar"] .stButton > button {
-        width: 100%;
-        text-align: left !important;
-        padding: 7px 8px !important;
-        border: none;
-        background-color: transparent;
-        font-size: 13px;
-        margin: 0 !important;
-        line-height: 1.5;
-        justify-content: flex-start !important;
-        align-items: flex-start !important;
-        min-height: 0 !important;
-        height: auto !important;
-        border-radius: 6px !important;
-    }
-    
-    section[data-testid="stSidebar"] .stButton > button > div {
-        text-align: left !important;
-        display: inline-block;
-        width: 100%;
-        padding: 0 !important;
-        margin: 0 !important;
-    }
-    
-    section[data-testid="stSidebar"] .stButton > button:hover {
-        background-color: #f0f2f6;
-    }
-    
-    /* Additional spacing reduction for sidebar elements */
-    section[data-testid="stSidebar"] .element-container {
-        margin-bottom: 0 !important;
-        padding-bottom: 0 !important;
-    }
-    
-    section[data-testid="stSidebar"] .st-emotion-cache-16txtl3 {
-        padding-top: 0 !important;
-        padding-bottom: 0 !important;
-    }
-    
-    section[data-testid="stSidebar"] .st-emotion-cache-16idsys p {
-        margin-bottom: 0 !important;
-        margin-top: 0 !important;
-    }
-    
-    section[data-testid="stSidebar"] .stButton {
-        margin-bottom: -10px !important;
-        border-radius: 2px !important;
-    }
-    
-    /* Style for delete button - modified to make it smaller */
-    .delete-btn {
-        color: #ff4b4b;
-        background: none;
-        border: none;
-        cursor: pointer;
-        float: right;
-        padding: 0 3px;
-        font-size: 12px;
-        line-height: 1;
-    }
-    
-    /* For the delete icon button in sidebar */
-    section[data-testid="stSidebar"] .stButton:nth-child(2) > button {
-        font-size: 10px !important;
-        padding: 0 2px !important;
-        min-width: 20px !important;
-        height: 20px !important;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-    }
-    
-    /* Custom close button styling */
-    .close-button {
-        color: #777777 !important; /* Neutral gray color instead of red */
-        font-size: 8px !important; /* Smaller font size */
-        padding: 0 !important;
-        min-width: 16px !important;
-        height: 16px !important;
-        display: flex !important;
-        justify-content: center !important;
-        align-items: center !important;
-        line-height: 1 !important;
-    }
-    
-    /* Improved chat history row styling */
-    .chat-history-row {
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        margin-bottom: 5px;
-    }
-    
-    /* Custom styling for sidebar column layout */
-    section[data-testid="stSidebar"] div.row-widget.stHorizontal {
-        display: flex;
-        align-items: center;
-        gap: 2px;
-    }
-    
-    /* Chat history button in sidebar */
-    section[data-testid="stSidebar"] div.row-widget.stHorizontal > div:first-child .stButton > button {
-        padding: 2px 6px !important;
-        min-height: 24px !important;
-    }
-    
-    /* Delete button in sidebar */
-    section[data-testid="stSidebar"] div.row-widget.stHorizontal > div:last-child .stButton > button {
-        padding: 2px !important;
-        min-height: 24px !important;
-        min-width: 24px !important;
-        width: 24px !important;
-        height: 24px !important;
-        display: flex !important;
-        justify-content: center !important;
-        align-items: center !important;
-        font-size: 12px !important;
-        color: #777 !important;
-    }
-    
-    .chat-title {
-        flex-grow: 1;
-        overflow: hidden;
-        text-overflow: ellipsis;
-        white-space: nowrap;
-    }
-
-    /* Footer styling */
-    .footer {
-        position: fixed;
-        bottom: 0;
-        left: 22%; /* Position after the sidebar (sidebar is typically ~22% of screen width) */
-        right: 0;
-        background-color: transparent;
-        padding: 10px 0;
-        text-align: center;
-        font-size: 14px;
-        color: #333;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        width: 78%; /* Width should be 100% minus the sidebar width */
-        margin-top: 20px;
-        z-index: 100;
-    }
-    
-    .footer-content {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        gap: 15px;
-    }
-    
-    .footer-logo {
-        height: 30px;
-        width: auto;
-    }
-    
-    .footer-text {
-        font-weight: bold;
-        margin: 0 10px;
-    }
-    
-    /* Logout button in sidebar */
-    .logout-btn {
-        width: 100%;
-        text-align: center !important;
-        padding: 8px !important;
-        margin-top: 10px !important;
-        margin-bottom: 15px !important;
-        background-color: transparent !important;
-        color: black !important;
-        border-radius: 4px !important;
-        border: 1px solid black !important;
-        cursor: pointer !important;
-        font-weight: bold !important;
-    }
-    
-    .logout-btn:hover {
-        background-color: #f0f2f6 !important;
-    }
-    
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(stylesheet("chatbot.css"), unsafe_allow_html=True)
 
 
 try:
-
-    image_paths = [
-        Path(__file__).parent.parent / "assets" / "codingbot.png",
-
-    ]
-    
-    image_found = False
-    for img_path in image_paths:
-        try:
-            if Path(img_path).exists():
-                st.sidebar.image(str(img_path), width=150, use_column_width=True)
-                image_found = True
-                break
-        except:
-            continue
-    
-    if not image_found:
+    logo = sidebar_logo()
+    # With static serving the browser fetches and caches the logo by URL instead of receiving it on every rerun
+    logo_url = static_url(logo) if logo and st.get_option("server.enableStaticServing") else None
+    if logo_url:
+        st.sidebar.markdown(f"<img src='{logo_url}' alt='Coding Bot' style='width: 100%;'>", unsafe_allow_html=True)
+    elif logo:
+        st.sidebar.image(logo, use_column_width=True)
+    else:
         st.sidebar.markdown("### Coding Bot")
 except Exception as e:
     st.sidebar.write("Coding Bot") 
 
 
-st.sidebar.markdown(
-    """
-    <style>
-    /* Ensure the logout button always has a black border */
-    [data-testid="stButton"] button[kind="primary"] {
-        background-color: transparent !important;
-        color: black !important;
-        border: 1px solid black !important; 
-        text-align: center !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    [data-testid="stButton"] button[kind="primary"] > div {
-        text-align: center !important;
-        display: flex !important;
-        justify-content: center !important;
-        align-items: center !important;
-        width: 100% !important;
-    }
-    
-    [data-testid="stButton"] button[kind="primary"]:hover {
-        background-color: rgba(0, 0, 0, 0.05) !important;
-        color: black !important;
-        border: 1px solid black !important;
-        transform: translateY(-2px) !important;
-        box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1) !important;
-    }
-    
-    /* More specific selector to override any conflicting styles */
-    section[data-testid="stSidebar"] [data-testid="stButton"] button[kind="primary"] {
-        border: 2px solid black !important;
-        margin-top: 5px !important;
-        margin-bottom: 5px !important;
-    }
-    
-    /* Additional hover effect for sidebar logout button */
-    section[data-testid="stSidebar"] [data-testid="stButton"] button[kind="primary"]:hover {
-        background-color: rgba(0, 0, 0, 0.1) !important;
-        transform: translateY(-2px) !important;
-        box-shadow: 0 3px 8px rgba(0, 0, 0, 0.15) !important;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
 
 if st.sidebar.button("Logout", key="sidebar_logout_btn", type="primary", use_container_width=True):
     if st.session_state.get('authenticated', False):
+        if st.session_state.get('session_token'):
+            revoke_session(st.session_state['session_token'])
+        remove_export()
         st.session_state.clear() 
         st.session_state['logout'] = True  
         st.query_params = {}  
@@ -479,42 +388,93 @@ if st.sidebar.button("Logout", key="sidebar_logout_btn", type="primary", use_con
 st.sidebar.markdown("<hr style='margin: 5px 0px 0px 0px; border: none; height: 1px; background-color: #e0e0e0;'>", unsafe_allow_html=True)
 
 st.sidebar.markdown("<h3 style='margin-top: 0px; margin-bottom: 10px;'>Previous Chats</h3>", unsafe_allow_html=True)
-chat_histories = load_chat_histories()
-
-if chat_histories:
-    # Sort by timestamp in descending order
-    sorted_histories = sorted(
-        chat_histories,
-        key=lambda x: x[1].get('timestamp', ''),
-        reverse=True
-    )
-    
-  
-    for idx, (chat_file, chat_data) in enumerate(sorted_histories):
-        col1, col2 = st.sidebar.columns([8, 1])  
+search_query = st.sidebar.text_input("Search chats", key="chat_search", placeholder="Search chats...",
+                                     label_visibility="collapsed").strip()
+
+if search_query:
+    search_results = search_chat_histories(search_query)
+    for result in search_results:
+        if st.sidebar.button(
+            f"{result['title'][:30]}{'...' if len(result['title']) > 30 else ''}",
+            key=f"search_result_{result['id']}",
+            use_container_width=True
+        ):
+            open_chat(result['id'])
+            st.rerun()
+        st.sidebar.caption(result['snippet'])
+    if not search_results:
+        st.sidebar.info("No chats match your search")
+else:
+    total_chats = get_user_chat_store().count_chats()
+    page_count = max(1, -(-total_chats // CHATS_PER_PAGE))
+    st.session_state['chat_page'] = min(st.session_state['chat_page'], page_count - 1)
+    chat_histories = load_chat_histories(st.session_state['chat_page'])
+
+    if chat_histories:
+        for chat in chat_histories:
+            chat_id = chat['id']
+            col1, col2 = st.sidebar.columns([8, 1])  
         
-        with col1:
+            with col1:
          
-            if st.button(
-                f"{chat_data['first_query'][:30]}{'...' if len(chat_data['first_query']) > 30 else ''}",
-                key=f"chat_history_{idx}",
-                use_container_width=True
-            ):
-                st.session_state['chat_history'] = chat_data['messages']
-                st.session_state['current_chat_id'] = chat_file
-                st.rerun()
+                if st.button(
+                    f"{chat['title'][:30]}{'...' if len(chat['title']) > 30 else ''}",
+                    key=f"chat_history_{chat_id}",
+                    use_container_width=True
+                ):
+                    open_chat(chat_id)
+                    st.rerun()
         
-        with col2:
+            with col2:
           
-            if st.button("✕", key=f"delete_{idx}", help="Delete this chat history", 
-                        type="secondary"):
-                if delete_chat_history(chat_file):
-                    st.success("Chat deleted")
+                if st.button("✕", key=f"delete_{chat_id}", help="Delete this chat history", 
+                            type="secondary"):
+                    if delete_chat_history(chat_id):
+                        if chat_id == st.session_state['current_chat_id']:
+                            set_current_chat([], None)
+                        st.success("Chat deleted")
+                        st.rerun()
+                    else:
+                        st.error("Failed to delete chat")
+
+        if page_count > 1:
+            col_prev, col_page, col_next = st.sidebar.columns([1, 2, 1])
+            with col_prev:
+                if st.button("‹", key="chat_page_prev", disabled=st.session_state['chat_page'] == 0):
+                    st.session_state['chat_page'] -= 1
                     st.rerun()
-                else:
-                    st.error("Failed to delete chat")
-else:
-    st.sidebar.info("No chat history available")
+            with col_page:
+                st.caption(f"Page {st.session_state['chat_page'] + 1} of {page_count}")
+            with col_next:
+                if st.button("›", key="chat_page_next", disabled=st.session_state['chat_page'] >= page_count - 1):
+                    st.session_state['chat_page'] += 1
+                    st.rerun()
+    else:
+        st.sidebar.info("No chat history available")
+
+if SHOW_MEMORY_VIEW:
+    with st.sidebar.expander("Session memory"):
+        memory_usage = st.session_state['chat_history'].memory_usage()
+        memory_usage['rendered_messages'] = len(st.session_state['rendered_messages'])
+        memory_usage['context_tokens'] = st.session_state['llm_context'].prompt_tokens()
+        st.json(memory_usage)
+
+with st.sidebar.expander("Export / import chats"):
+    if st.button("Prepare export", key="prepare_export", use_container_width=True):
+        export_user_archive()
+    export_path = st.session_state.get('export_path')
+    if export_path and os.path.exists(export_path):
+        with open(export_path, "rb") as export_file:
+            st.download_button("Download archive", export_file, key="download_archive",
+                               file_name=f"{st.session_state['username']}-chats.jsonl.gz",
+                               mime="application/gzip", use_container_width=True, on_click=remove_export)
+    uploaded_archive = st.file_uploader("Import an archive", type=["gz"], key="archive_upload")
+    if uploaded_archive is not None and st.button("Import", key="import_archive", use_container_width=True):
+        try:
+            result = import_user_archive(uploaded_archive)
+            st.success(f"Imported {result['imported']} chats, skipped {result['duplicates']} already present")
+        except ArchiveError as e:
+            st.error(str(e))
 
 # Display welcome message if chat history is empty
 if not st.session_state['chat_history']:
@@ -530,18 +490,7 @@ if not st.session_state['chat_history']:
 
 chat_container = st.container()
 with chat_container:
-    for message in st.session_state['chat_history']:
-        role, text, code = message
-        if role == "user":
-            st.markdown(f"<div class='user-message'>{text}</div>", unsafe_allow_html=True)
-        else:
-           
-            if code:
-                st.markdown(f"<div class='bot-message'>{text}</div>", unsafe_allow_html=True)
-                st.code(code, language="python")  
-            else:
-               
-                st.markdown(text, unsafe_allow_html=False)  
+    chat_history_view()
 
 
 st.markdown("""
@@ -556,8 +505,8 @@ user_input = st.chat_input("Ask me anything about coding...")
 
 if user_input:
  
-    st.session_state['chat_history'].append(("user", user_input, None))
-    st.markdown(f"<div class='user-message'>{user_input}</div>", unsafe_allow_html=True)
+    save_message("user", user_input)
+    render_blocks(message_blocks(len(st.session_state['chat_history']) - 1))
 
     thinking_placeholder = st.empty()
     with thinking_placeholder.container():
@@ -585,31 +534,15 @@ if user_input:
         """, unsafe_allow_html=True)
 
 
-    # Get and display response from gyancoder.py
-    bot_response = get_response(user_input)
+    # Stream the response from gyancoder.py into the placeholder as it arrives
+    bot_response, segments = get_response(user_input, thinking_placeholder)
 
     thinking_placeholder.empty()
 
-    # Check if the response contains a code block
-    if "```python" in bot_response and "```" in bot_response:
-        # Extract the explanation and code block
-        code_start = bot_response.find("```python") + 9
-        code_end = bot_response.find("```", code_start)
-        code_block = bot_response[code_start:code_end].strip()
-        bot_message = bot_response.replace(f"```python\n{code_block}\n```", "").strip()
-
-        # Add bot response to history with extracted code
-        st.session_state['chat_history'].append(("assistant", bot_message, code_block))
-
-        # Display explanation (if any) and code block
-        if bot_message:
-            st.markdown(bot_message, unsafe_allow_html=False)  
-        st.code(code_block, language="python") 
-    else:
-        st.session_state['chat_history'].append(("assistant", bot_response, None))
-        st.markdown(bot_response, unsafe_allow_html=False) 
-    
-    save_chat_history()
+    # Store the response with its text and code segments and display it
+    save_message("assistant", bot_response, segments)
+    save_context_state()
+    render_blocks(message_blocks(len(st.session_state['chat_history']) - 1))
     
     # Refresh the page after response generation
     st.rerun()
@@ -0,0 +1,22 @@
+import os
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directory holding all runtime data (users, chats, caches, logs); defaults to the source directory
+DATA_ROOT = os.path.abspath(os.getenv("GYAN_DATA_ROOT", SRC_DIR))
+os.makedirs(DATA_ROOT, exist_ok=True)
+
+# Parent of the per-user chat directories
+CHATS_DIR = os.path.join(DATA_ROOT, "users_chat")
+
+
+def data_path(*parts):
+    """Return a path under DATA_ROOT."""
+    return os.path.join(DATA_ROOT, *parts)
+
+
+def user_chat_dir(username):
+    """Return a user's chat directory, creating it if needed."""
+    path = os.path.join(CHATS_DIR, username)
+    os.makedirs(path, exist_ok=True)
+    return path
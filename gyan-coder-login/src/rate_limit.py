@@ -0,0 +1,181 @@
+import os
+import random
+import threading
+import time
+
+# Provider limits for the model; 0 disables the corresponding bucket
+REQUESTS_PER_MINUTE = float(os.getenv("GYAN_REQUESTS_PER_MINUTE", "30"))
+TOKENS_PER_MINUTE = float(os.getenv("GYAN_TOKENS_PER_MINUTE", "6000"))
+
+# Seconds a request may spend waiting for capacity and retrying before it fails
+REQUEST_DEADLINE = float(os.getenv("GYAN_REQUEST_DEADLINE", "90"))
+
+# Exponential backoff between retries, in seconds
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+MAX_ATTEMPTS = 6
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request cannot be sent or retried before its deadline."""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``per_minute`` units per minute.
+
+    Callers reserve capacity up front and sleep until their reservation is
+    covered, so short bursts over the limit are queued in arrival order
+    instead of failing.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Reserve amount units and return how many seconds the caller must wait."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.available -= amount
+            wait = max(0.0, -self.available / self.rate, self.paused_until - now)
+        return wait
+
+    def charge(self, amount):
+        """Consume capacity after the fact, e.g. completion tokens reported by the provider."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.available -= amount
+
+    def pause(self, seconds):
+        """Hold back new reservations for the given number of seconds."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Client-side limiter for requests and tokens per minute."""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def acquire(self, tokens, deadline):
+        """Wait until a request of the given prompt size may be sent.
+
+        Raises DeadlineExceeded without waiting when the wait would pass
+        the deadline (a time.monotonic() value).
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if time.monotonic() + wait > deadline:
+            # Give the reservation back; this request will not be sent
+            if self.requests is not None:
+                self.requests.charge(-1)
+            self.charge(-tokens)
+            raise DeadlineExceeded("The assistant is over its rate limit, please try again shortly.")
+        if wait:
+            time.sleep(wait)
+
+    def charge(self, tokens):
+        if self.tokens is not None and tokens:
+            self.tokens.charge(tokens)
+
+    def pause(self, seconds):
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
+
+
+def retry_after_seconds(error):
+    """Return the delay requested by the provider's Retry-After headers, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error):
+    # Imported here so importing this module does not pull in the Groq SDK
+    import groq
+
+    if isinstance(error, groq.APIConnectionError):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def call_with_retry(func, deadline, limiter=None, max_attempts=MAX_ATTEMPTS):
+    """Call func, retrying transient failures with jittered exponential backoff.
+
+    A Retry-After from the provider sets the minimum delay and also pauses
+    the limiter so other requests back off too. Gives up with the last
+    error when the next attempt would start after the deadline.
+    """
+    for attempt in range(max_attempts):
+        try:
+            return func()
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_attempts - 1:
+                raise
+            retry_after = retry_after_seconds(e)
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                if limiter is not None:
+                    limiter.pause(retry_after)
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def configure_rate_limiter(requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+    """Replace the process-wide rate limiter with one using the given limits."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    return _rate_limiter
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from paths import data_path
+
+# Number of answers kept in memory
+MEMORY_ENTRIES = int(os.getenv("GYAN_CACHE_MEMORY_ENTRIES", "512"))
+
+# Number of answers kept in the SQLite tier
+DISK_ENTRIES = int(os.getenv("GYAN_CACHE_DISK_ENTRIES", "20000"))
+
+# Seconds before a cached answer expires
+CACHE_TTL = float(os.getenv("GYAN_CACHE_TTL", str(7 * 24 * 3600)))
+
+# SQLite file for the persistent tier
+CACHE_DB = os.getenv("GYAN_CACHE_DB", data_path("response_cache.db"))
+
+
+def normalize_query(query):
+    """Normalize a query so trivially different phrasings share a cache entry."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def make_cache_key(query, messages, model):
+    """Build a cache key from the normalized query, the model and the prior messages."""
+    context_hash = hashlib.sha256(
+        json.dumps([model, messages], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return hashlib.sha256(f"{normalize_query(query)}\0{context_hash}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier answer cache: an in-memory LRU in front of a SQLite table.
+
+    Entries expire after ``ttl`` seconds. Each tier evicts its least
+    recently used entries once it holds more than its size limit.
+    """
+
+    def __init__(self, db_path=CACHE_DB, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES, ttl=CACHE_TTL):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self.db.commit()
+
+    def get(self, key):
+        """Return the cached answer for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self.memory[key]
+
+            if self.db is not None:
+                row = self.db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created <= self.ttl:
+                        self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                        self.db.commit()
+                        self._remember(key, value, created)
+                        self.counters["disk_hits"] += 1
+                        return value
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.db.commit()
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        """Store an answer in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.counters["stores"] += 1
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                # Expiry and size eviction scan the table, so only run them periodically
+                if self.counters["stores"] % 64 == 0:
+                    self._evict_disk(now)
+                self.db.commit()
+
+    def _remember(self, key, value, created):
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _evict_disk(self, now):
+        self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        (count,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.disk_entries:
+            removed = self.db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.disk_entries,),
+            ).rowcount
+            self.counters["evictions"] += removed
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+            if self.db is not None:
+                stats["disk_entries"] = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
@@ -0,0 +1,127 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+from paths import data_path
+from state_backend import get_state_backend
+
+# Seconds a session token stays valid
+SESSION_TTL = int(os.getenv("GYAN_SESSION_TTL", str(7 * 24 * 3600)))
+
+# File holding the signing key when GYAN_SESSION_SECRET is not set
+SECRET_FILE = data_path(".session_secret")
+
+# Length of a generated signing key, and the minimum length of GYAN_SESSION_SECRET
+SECRET_BYTES = 32
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _read_secret_file():
+    with open(SECRET_FILE, "rb") as file:
+        secret = file.read()
+    if len(secret) != SECRET_BYTES:
+        raise RuntimeError(f"{SECRET_FILE} does not hold a {SECRET_BYTES}-byte key; delete it to generate a new one.")
+    return secret
+
+
+def load_secret():
+    """Return the signing key, generating and persisting one if needed.
+
+    A generated key is written to a temporary file first and then linked
+    into place, so other processes never see a partly written key; when
+    two processes race, both use the key that was linked first.
+    """
+    secret = os.getenv("GYAN_SESSION_SECRET")
+    if secret:
+        secret = secret.encode("utf-8")
+        if len(secret) < SECRET_BYTES:
+            raise RuntimeError(f"GYAN_SESSION_SECRET must be at least {SECRET_BYTES} bytes long.")
+        return secret
+    try:
+        return _read_secret_file()
+    except FileNotFoundError:
+        pass
+    temp_file = f"{SECRET_FILE}.{os.getpid()}.tmp"
+    fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(secrets.token_bytes(SECRET_BYTES))
+            file.flush()
+            os.fsync(file.fileno())
+        os.link(temp_file, SECRET_FILE)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_file)
+    return _read_secret_file()
+
+
+_secret = None
+
+
+def _signature(message):
+    global _secret
+    if _secret is None:
+        _secret = load_secret()
+    return hmac.new(_secret, message.encode("ascii"), hashlib.sha256).digest()
+
+
+def issue_token(username, ttl=SESSION_TTL):
+    """Return a signed token identifying username until it expires."""
+    message = f"{_b64encode(username.encode('utf-8'))}.{int(time.time() + ttl)}"
+    return f"{message}.{_b64encode(_signature(message))}"
+
+
+def verify_token(token):
+    """Return the username for a valid, unexpired and not revoked token, otherwise None."""
+    try:
+        encoded_user, expires, signature = token.split(".")
+        message = f"{encoded_user}.{expires}"
+        if not hmac.compare_digest(_b64decode(signature), _signature(message)):
+            return None
+        if int(expires) < time.time():
+            return None
+        username = _b64decode(encoded_user).decode("utf-8")
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if get_state_backend().get("revoked_sessions", _session_key(token)) is not None:
+        return None
+    return username
+
+
+def _session_key(token):
+    # Tokens are credentials; the backend only sees their hash
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def save_session(token, **fields):
+    """Store fields (e.g. the current chat) for a session in the shared state backend.
+
+    Any replica can then resume the session from its token.
+    """
+    get_state_backend().set("sessions", _session_key(token), fields, ttl=SESSION_TTL)
+
+
+def load_session(token):
+    """Return the stored fields of a session, or None when nothing was stored."""
+    return get_state_backend().get("sessions", _session_key(token))
+
+
+def revoke_session(token):
+    """Invalidate a token on every replica, e.g. on logout.
+
+    The revocation has its own key, so a later save_session for the same
+    token, e.g. from another tab, cannot undo it.
+    """
+    get_state_backend().set("revoked_sessions", _session_key(token), True, ttl=SESSION_TTL)
+    get_state_backend().delete("sessions", _session_key(token))
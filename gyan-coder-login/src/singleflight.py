@@ -0,0 +1,188 @@
+import threading
+
+_PENDING = object()
+
+
+class Flight:
+    """One in-flight call whose result or chunks are shared by every caller with the same key."""
+
+    def __init__(self):
+        self.chunks = []
+        self.result = _PENDING
+        self.error = None
+        self.done = False
+        self.followers = 0
+        self.readers = 1  # Callers still reading a stream; the leader counts as one
+        self.upstream = None
+        self.condition = threading.Condition()
+
+    def _finish(self, result=None, error=None):
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def _pump(self, chunks):
+        try:
+            for chunk in chunks:
+                with self.condition:
+                    self.chunks.append(chunk)
+                    self.condition.notify_all()
+        except Exception as e:
+            self._finish(error=e)
+        else:
+            self._finish()
+
+    def _detach(self):
+        """Drop one reader. Returns True when it was the last and the call is still running."""
+        with self.condition:
+            self.readers -= 1
+            return self.readers == 0 and not self.done
+
+    def wait(self):
+        with self.condition:
+            while not self.done:
+                self.condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def iter_chunks(self):
+        """Yield every chunk from the start, waiting for new ones until the call ends."""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                pending = self.chunks[index:]
+                done, error = self.done, self.error
+            index += len(pending)
+            yield from pending
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class FlightReader:
+    """One caller's iterator over a streamed flight.
+
+    Closing it, or dropping it, detaches the caller; once no caller is
+    left the upstream stream is closed.
+    """
+
+    def __init__(self, group, key, flight):
+        self.group = group
+        self.key = key
+        self.flight = flight
+        self.chunks = flight.iter_chunks()
+        self.attached = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.attached:
+            self.attached = False
+            self.group._detach(self.key, self.flight)
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """Coalesces identical calls that are in flight at the same time.
+
+    The first caller for a key (the leader) makes the call; callers that
+    arrive with the same key before it finishes attach to it instead of
+    starting their own. Finished calls are forgotten immediately, so this
+    only deduplicates concurrent work; the response cache covers repeats.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def _join(self, key):
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                with flight.condition:
+                    flight.followers += 1
+                    flight.readers += 1
+                return flight, False
+            flight = Flight()
+            self.flights[key] = flight
+            return flight, True
+
+    def _forget(self, key, flight):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def _detach(self, key, flight):
+        # Under self.lock, so no new follower can join a flight that is being abandoned
+        with self.lock:
+            abandoned = flight._detach()
+            if abandoned and self.flights.get(key) is flight:
+                del self.flights[key]
+        if abandoned:
+            close = getattr(flight.upstream, "close", None)
+            if close is not None:
+                close()
+
+    def do(self, key, func):
+        """Return (result, shared): func()'s result, and whether it came from another caller's call."""
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                flight._finish(result=func())
+            except Exception as e:
+                flight._finish(error=e)
+            finally:
+                self._forget(key, flight)
+        return flight.wait(), not leader
+
+    def stream(self, key, func):
+        """Return (chunks, shared) for a streaming call.
+
+        func returns an iterator of chunks. It is consumed on a background
+        thread so the stream keeps going for the followers even if the
+        leader stops reading; followers joining late replay the chunks
+        received so far. chunks is a FlightReader; once every caller has
+        closed or dropped theirs, the iterator's close() is called, if it
+        has one, to stop the upstream call. Errors, including one raised
+        by func itself, are raised to every caller.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                chunks = func()
+            except Exception as e:
+                flight._finish(error=e)
+                self._forget(key, flight)
+                raise
+
+            flight.upstream = chunks
+
+            def pump():
+                try:
+                    flight._pump(chunks)
+                finally:
+                    self._forget(key, flight)
+
+            threading.Thread(target=pump, name="singleflight-stream", daemon=True).start()
+        return FlightReader(self, key, flight), not leader
+
+    def in_flight(self):
+        """Return the number of calls currently in flight."""
+        with self.lock:
+            return len(self.flights)
@@ -0,0 +1,256 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from paths import data_path
+
+# Where shared state lives: "memory" (this process only), "sqlite" (shared by the processes of one host;
+# WAL mode does not work on network filesystems) or "redis" (any Redis-compatible server, shared by every replica)
+STATE_BACKEND = os.getenv("GYAN_STATE_BACKEND", "memory")
+
+# SQLite file for the sqlite backend
+STATE_DB = os.getenv("GYAN_STATE_DB", data_path("state.db"))
+
+# Seconds between sweeps of expired entries in the memory backend
+MEMORY_SWEEP_INTERVAL = 60
+
+# Server for the redis backend
+REDIS_URL = os.getenv("GYAN_REDIS_URL", "redis://localhost:6379/0")
+
+# Prefix of every key written to Redis, so several deployments can share a server
+REDIS_PREFIX = os.getenv("GYAN_REDIS_PREFIX", "gyan")
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _expiry(ttl):
+    return time.time() + ttl if ttl else None
+
+
+class MemoryBackend:
+    """In-process key-value state, grouped by namespace. The default for a single replica.
+
+    Values are stored as JSON, like the shared backends, so callers never
+    share mutable objects and behave the same on every backend. Expired
+    entries are swept out on writes every MEMORY_SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, sweep_interval=MEMORY_SWEEP_INTERVAL):
+        self.data = {}
+        self.lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self.next_sweep = time.time() + sweep_interval
+
+    def _sweep(self, now):
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + self.sweep_interval
+        expired = [entry_key for entry_key, (_, expires_at) in self.data.items()
+                   if expires_at is not None and expires_at <= now]
+        for entry_key in expired:
+            del self.data[entry_key]
+
+    def _live(self, namespace, key, now):
+        entry = self.data.get((namespace, key))
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self.data[(namespace, key)]
+            return None
+        return entry
+
+    def get(self, namespace, key):
+        with self.lock:
+            entry = self._live(namespace, key, time.time())
+        return json.loads(entry[0]) if entry is not None else None
+
+    def set(self, namespace, key, value, ttl=None):
+        with self.lock:
+            self._sweep(time.time())
+            self.data[(namespace, key)] = (_encode(value), _expiry(ttl))
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set key only if it does not exist. Returns False if it did."""
+        with self.lock:
+            now = time.time()
+            self._sweep(now)
+            if self._live(namespace, key, now) is not None:
+                return False
+            self.data[(namespace, key)] = (_encode(value), _expiry(ttl))
+            return True
+
+    def compare_and_set(self, namespace, key, expected, value, ttl=None):
+        """Set key only if its current value equals expected. Returns False if it did not."""
+        with self.lock:
+            entry = self._live(namespace, key, time.time())
+            if entry is None or json.loads(entry[0]) != expected:
+                return False
+            self.data[(namespace, key)] = (_encode(value), _expiry(ttl))
+            return True
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.data.pop((namespace, key), None)
+
+    def items(self, namespace):
+        """Return {key: value} for every live key in namespace."""
+        now = time.time()
+        with self.lock:
+            keys = [key for entry_namespace, key in self.data if entry_namespace == namespace]
+            entries = {key: self._live(namespace, key, now) for key in keys}
+        return {key: json.loads(entry[0]) for key, entry in entries.items() if entry is not None}
+
+
+class SqliteBackend:
+    """Key-value state in a SQLite table in WAL mode, shared by every process that opens the file."""
+
+    def __init__(self, path=STATE_DB):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+
+    def get(self, namespace, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, _encode(value), _expiry(ttl)),
+            )
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set key only if it does not exist. Returns False if it did."""
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (namespace, key, time.time()),
+            )
+            inserted = self.db.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, _encode(value), _expiry(ttl)),
+            ).rowcount
+        return inserted > 0
+
+    def compare_and_set(self, namespace, key, expected, value, ttl=None):
+        """Set key only if its current value equals expected. Returns False if it did not."""
+        with self.lock, self.db:
+            # BEGIN IMMEDIATE takes the write lock first, so no other process can change the row in between
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+            if row is None or json.loads(row[0]) != expected:
+                return False
+            self.db.execute(
+                "UPDATE state SET value = ?, expires_at = ? WHERE namespace = ? AND key = ?",
+                (_encode(value), _expiry(ttl), namespace, key),
+            )
+        return True
+
+    def delete(self, namespace, key):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace):
+        """Return {key: value} for every live key in namespace."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time()),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+
+class RedisBackend:
+    """Key-value state in Redis (or a compatible server such as Valkey or KeyDB), shared by every replica.
+
+    Each namespace is a key prefix; expiry uses Redis TTLs. Needs the
+    ``redis`` package, which is only imported when this backend is used.
+    """
+
+    def __init__(self, url=REDIS_URL, prefix=REDIS_PREFIX):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("GYAN_STATE_BACKEND=redis needs the redis package (pip install redis).")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.watch_error = redis.WatchError
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        value = self.client.get(self._key(namespace, key))
+        return json.loads(value) if value is not None else None
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(self._key(namespace, key), _encode(value), ex=int(ttl) if ttl else None)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set key only if it does not exist. Returns False if it did."""
+        return bool(self.client.set(self._key(namespace, key), _encode(value), ex=int(ttl) if ttl else None, nx=True))
+
+    def compare_and_set(self, namespace, key, expected, value, ttl=None):
+        """Set key only if its current value equals expected. Returns False if it did not."""
+        full_key = self._key(namespace, key)
+        with self.client.pipeline() as pipe:
+            try:
+                # The transaction fails if another client writes the key after WATCH
+                pipe.watch(full_key)
+                current = pipe.get(full_key)
+                if current is None or json.loads(current) != expected:
+                    return False
+                pipe.multi()
+                pipe.set(full_key, _encode(value), ex=int(ttl) if ttl else None)
+                pipe.execute()
+                return True
+            except self.watch_error:
+                return False
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def items(self, namespace):
+        """Return {key: value} for every key in namespace."""
+        prefix = self._key(namespace, "")
+        result = {}
+        for full_key in self.client.scan_iter(match=prefix + "*", count=500):
+            value = self.client.get(full_key)
+            if value is not None:
+                full_key = full_key.decode("utf-8") if isinstance(full_key, bytes) else full_key
+                result[full_key[len(prefix):]] = json.loads(value)
+        return result
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend():
+    """Return the process-wide state backend selected by GYAN_STATE_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if STATE_BACKEND == "sqlite":
+                _backend = SqliteBackend()
+            elif STATE_BACKEND == "redis":
+                _backend = RedisBackend()
+            else:
+                _backend = MemoryBackend()
+    return _backend
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Context window of each model, in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "qwen-qwq-32b": 131072,
+    "llama-3.1-8b-instant": 131072,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# Tokens added by the chat format around every message, and once per request
+MESSAGE_OVERHEAD = 4
+REQUEST_OVERHEAD = 3
+
+# Completion budget by query type; reasoning models spend part of it thinking
+MAX_TOKENS_POLICY = {
+    "quick": int(os.getenv("GYAN_MAX_TOKENS_QUICK", "2048")),
+    "default": int(os.getenv("GYAN_MAX_TOKENS_DEFAULT", "4096")),
+    "code": int(os.getenv("GYAN_MAX_TOKENS_CODE", "6144")),
+}
+
+# Smallest completion budget worth sending a request for
+MIN_COMPLETION_TOKENS = 256
+
+# Words, runs of digits, single punctuation marks and line breaks, roughly as a BPE tokenizer splits them
+_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]|\n")
+_CODE_HINTS = re.compile(
+    r"```|\b(write|implement|create|build|fix|debug|refactor|optimi[sz]e|convert|traceback|error)\b", re.I
+)
+
+
+# Token counts remembered for recently seen texts
+TOKEN_CACHE_SIZE = 16384
+
+# Texts shorter than this are counted directly; caching them would save nothing
+MIN_CACHED_LENGTH = 256
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in text without a tokenizer.
+
+    Counts of longer texts are cached under a digest of the text rather
+    than the text itself, so each message is only counted once however
+    many requests it is sent with, without the cache keeping it alive.
+    """
+    if len(text) < MIN_CACHED_LENGTH:
+        return _count_tokens(text)
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = _count_tokens(text)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def _count_tokens(text):
+    count = 0
+    for piece in _PIECES.findall(text):
+        # Long words are split into several sub-word tokens
+        count += 1 + len(piece) // 6 if piece.isalpha() else 1
+    return count
+
+
+def count_message_tokens(messages):
+    """Estimate the prompt tokens of a chat message list."""
+    return REQUEST_OVERHEAD + sum(MESSAGE_OVERHEAD + estimate_tokens(message["content"]) for message in messages)
+
+
+def context_window(model):
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def classify_query(query):
+    """Classify a query as "code", "quick" or "default" for completion budgeting."""
+    if _CODE_HINTS.search(query):
+        return "code"
+    if len(query) < 120 and "\n" not in query:
+        return "quick"
+    return "default"
+
+
+def choose_max_tokens(messages, model, query_type="default"):
+    """Pick max_tokens from the query-type policy and what is left of the context window.
+
+    Returns None when the prompt leaves less than MIN_COMPLETION_TOKENS,
+    meaning the caller should trim the context first.
+    """
+    remaining = context_window(model) - count_message_tokens(messages)
+    if remaining < MIN_COMPLETION_TOKENS:
+        return None
+    return min(MAX_TOKENS_POLICY.get(query_type, MAX_TOKENS_POLICY["default"]), remaining)
@@ -0,0 +1,229 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from message_parser import normalize_message, segments_to_markdown
+
+# Approximate bytes of messages a session keeps in memory before older ones are dropped to the chat store
+SESSION_MEMORY_CAP = int(os.getenv("GYAN_SESSION_MEMORY_BYTES", str(1024 * 1024)))
+
+# Most recent messages always kept in memory, whatever their size
+MIN_RESIDENT = 30
+
+# Messages read back from the chat store at a time when an older message is needed
+PAGE_SIZE = 50
+
+# Bytes of code blocks the process-wide code table keeps for sharing between messages
+SHARED_CODE_BYTES = int(os.getenv("GYAN_SHARED_CODE_BYTES", str(8 * 1024 * 1024)))
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+class CodeTable:
+    """Process-wide table that lets identical code blocks share one string.
+
+    Unlike sys.intern, which keeps strings alive for good on some Python
+    versions, the table is bounded: beyond ``max_bytes`` the least
+    recently shared blocks are forgotten. Messages still holding a
+    forgotten block keep it alive as long as they need it.
+    """
+
+    def __init__(self, max_bytes=SHARED_CODE_BYTES):
+        self.max_bytes = max_bytes
+        self.strings = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def share(self, code):
+        """Return the table's copy of code, adding code when it has none."""
+        with self.lock:
+            shared = self.strings.get(code)
+            if shared is not None:
+                self.strings.move_to_end(code)
+                return shared
+            self.strings[code] = code
+            self.nbytes += sys.getsizeof(code)
+            while self.nbytes > self.max_bytes and self.strings:
+                _, forgotten = self.strings.popitem(last=False)
+                self.nbytes -= sys.getsizeof(forgotten)
+            return code
+
+
+CODE_TABLE = CodeTable()
+
+
+class Message:
+    """Compact chat message.
+
+    Roles and code languages are interned, and code blocks go through
+    CODE_TABLE, so identical code (e.g. the same answer served to many
+    sessions) is usually stored once per process. The markdown text of a reply is not kept
+    when it can be rebuilt from its segments, and the segments of a plain
+    text message are not kept when they are just its text.
+
+    Supports ``message["role"]`` etc. so code written for the dict format
+    keeps working.
+    """
+
+    __slots__ = ("role", "_text", "_segments")
+
+    def __init__(self, role, text, segments):
+        self.role = sys.intern(role)
+        # Text segments are kept as strings, code segments as (lang, code) pairs
+        compact = tuple(
+            (_intern(segment["lang"]), CODE_TABLE.share(segment["code"])) if segment["type"] == "code"
+            else segment["text"]
+            for segment in segments
+        )
+        self._text = text
+        self._segments = compact
+        if compact == (text,) or (not compact and not text):
+            self._segments = None
+        elif text == self._markdown():
+            self._text = None
+
+    @classmethod
+    def from_dict(cls, message):
+        if isinstance(message, cls):
+            return message
+        message = normalize_message(message)
+        return cls(message["role"], message["text"] or "", message["segments"])
+
+    def _markdown(self):
+        return segments_to_markdown(self.segments)
+
+    @property
+    def text(self):
+        return self._text if self._text is not None else self._markdown()
+
+    @property
+    def segments(self):
+        if self._segments is None:
+            return [{"type": "text", "text": self._text}] if self._text else []
+        return [
+            {"type": "text", "text": segment} if isinstance(segment, str)
+            else {"type": "code", "lang": segment[0], "code": segment[1]}
+            for segment in self._segments
+        ]
+
+    def __getitem__(self, key):
+        if key not in ("role", "text", "segments"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self):
+        return {"role": self.role, "text": self.text, "segments": self.segments}
+
+    def strings(self):
+        """Yield the strings this message holds, for memory accounting."""
+        if self._text is not None:
+            yield self._text
+        for segment in self._segments or ():
+            yield segment if isinstance(segment, str) else segment[1]
+
+    def nbytes(self):
+        """Approximate memory held by this message, counting shared code in full."""
+        size = sys.getsizeof(self) + sum(sys.getsizeof(string) for string in self.strings())
+        if self._segments is not None:
+            size += sys.getsizeof(self._segments) + sum(
+                sys.getsizeof(segment) for segment in self._segments if not isinstance(segment, str))
+        return size
+
+
+class Transcript:
+    """A session's chat messages with a cap on how much of it stays in memory.
+
+    Behaves like a list of messages indexed by chat position. Once the
+    messages in memory, including the page read back from the store,
+    exceed ``memory_cap`` bytes, the oldest resident ones are dropped
+    (they are already in the chat store). Dropped messages are read back
+    a PAGE_SIZE-aligned page at a time when they are needed again, e.g.
+    for "Load earlier messages", so reading them in order costs one query
+    per page. Without a chat store nothing is dropped.
+    """
+
+    def __init__(self, messages=(), chat_id=None, store=None, memory_cap=SESSION_MEMORY_CAP):
+        self.chat_id = chat_id
+        self.store = store
+        self.memory_cap = memory_cap
+        self.messages = [Message.from_dict(message) for message in messages]
+        self.offset = 0  # Chat position of messages[0]; earlier ones are only in the store
+        self.resident_bytes = sum(message.nbytes() for message in self.messages)
+        self.page_start = 0
+        self.page = []
+        self.page_bytes = 0
+        self.spilled = 0
+        self.paged_in = 0
+        self.spill()
+
+    def __len__(self):
+        return self.offset + len(self.messages)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transcript index out of range")
+        if index >= self.offset:
+            return self.messages[index - self.offset]
+        if not self.page_start <= index < self.page_start + len(self.page):
+            self._page_in(index)
+        return self.page[index - self.page_start]
+
+    def _page_in(self, index):
+        self.page_start = index - index % PAGE_SIZE
+        rows = self.store.load_messages(self.chat_id, offset=self.page_start,
+                                        limit=min(PAGE_SIZE, self.offset - self.page_start))
+        self.page = [Message.from_dict(row) for row in rows]
+        self.page_bytes = sum(message.nbytes() for message in self.page)
+        self.paged_in += len(self.page)
+        self.spill()
+
+    def append(self, message):
+        """Append a message, which must already be saved to the chat store if there is one."""
+        message = Message.from_dict(message)
+        self.messages.append(message)
+        self.resident_bytes += message.nbytes()
+        self.spill()
+        return message
+
+    def attach(self, chat_id, store):
+        """Associate the transcript with its chat once the chat has been created in the store."""
+        self.chat_id = chat_id
+        self.store = store
+        self.spill()
+
+    def spill(self):
+        """Drop the oldest resident messages while over the memory cap."""
+        if self.store is None or self.chat_id is None:
+            return
+        while self.resident_bytes + self.page_bytes > self.memory_cap and len(self.messages) > MIN_RESIDENT:
+            self.resident_bytes -= self.messages.pop(0).nbytes()
+            self.offset += 1
+            self.spilled += 1
+
+    def memory_usage(self):
+        """Return a memory accounting summary for this transcript."""
+        return {
+            "messages": len(self),
+            "resident_messages": len(self.messages),
+            "resident_bytes": self.resident_bytes,
+            "paged_messages": len(self.page),
+            "paged_bytes": self.page_bytes,
+            "total_bytes": self.resident_bytes + self.page_bytes,
+            "memory_cap_bytes": self.memory_cap,
+            "in_store_only": self.offset,
+            "shared_code_bytes": CODE_TABLE.nbytes,
+            "shared_code_limit_bytes": CODE_TABLE.max_bytes,
+            "spilled_total": self.spilled,
+            "paged_in_total": self.paged_in,
+        }
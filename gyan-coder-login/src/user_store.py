@@ -0,0 +1,261 @@
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from paths import data_path
+from state_backend import get_state_backend
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Storage backend for user records: "json" (users.json), "sqlite" or "state" (the shared state backend)
+USER_BACKEND = os.getenv("GYAN_USER_BACKEND", "json")
+
+# Location of the users file for each backend
+USERS_FILE = os.getenv("GYAN_USERS_FILE", data_path("users.json"))
+USERS_DB = os.getenv("GYAN_USERS_DB", data_path("users.db"))
+
+
+# Hash password for security
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def verify_credentials(store, username, password):
+    """Check a password against the stored hash in constant time."""
+    user = store.get(username)
+    return user is not None and hmac.compare_digest(user["password"], hash_password(password))
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive inter-process lock on ``path + '.lock'``."""
+    with open(path + ".lock", "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_json(path, data, indent=4):
+    """Write JSON to a temporary file next to ``path`` and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=indent)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonUserStore:
+    """User records in users.json with an in-memory index.
+
+    Reads are served from memory and the file is only re-parsed when its
+    mtime or size changes. Writes take a file lock, re-read the latest
+    version, and replace the file atomically, so concurrent signups
+    cannot lose each other's updates.
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self.users = {}
+        self.version = None
+        self.lock = threading.RLock()
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self):
+        version = self._file_version()
+        if version == self.version:
+            return
+        if version is None:
+            self.users = {}
+        else:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.users = json.load(file)
+        self.version = version
+
+    def get(self, username):
+        """Return a copy of the user's record, or None."""
+        with self.lock:
+            self._refresh()
+            record = self.users.get(username)
+            return dict(record) if record is not None else None
+
+    def all(self):
+        """Return a copy of every user record keyed by username."""
+        with self.lock:
+            self._refresh()
+            return {username: dict(record) for username, record in self.users.items()}
+
+    def _modify(self, change):
+        with self.lock, file_lock(self.path):
+            # Another process may have written since our last read
+            self.version = None
+            self._refresh()
+            if not change(self.users):
+                return False
+            atomic_write_json(self.path, self.users)
+            self.version = self._file_version()
+            return True
+
+    def add(self, username, record):
+        """Add a user. Returns False if the username is taken."""
+        def change(users):
+            if username in users:
+                return False
+            users[username] = dict(record)
+            return True
+        return self._modify(change)
+
+    def update(self, username, **fields):
+        """Update fields of an existing user. Returns False if the user does not exist."""
+        def change(users):
+            if username not in users:
+                return False
+            users[username].update(fields)
+            return True
+        return self._modify(change)
+
+
+class SqliteUserStore:
+    """User records in an indexed SQLite table, for large user bases.
+
+    Existing users.json records are imported the first time the table is
+    created.
+    """
+
+    def __init__(self, path=USERS_DB, import_from=USERS_FILE):
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.db:
+            exists = self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+            ).fetchone()
+            if not exists:
+                self.db.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT NOT NULL, email TEXT)")
+                if import_from and os.path.exists(import_from):
+                    for username, record in JsonUserStore(import_from).all().items():
+                        self.db.execute(
+                            "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                            (username, record["password"], record.get("email")),
+                        )
+
+    def get(self, username):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT password, email FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"password": row[0], "email": row[1]}
+
+    def all(self):
+        with self.lock:
+            rows = self.db.execute("SELECT username, password, email FROM users").fetchall()
+        return {username: {"password": password, "email": email} for username, password, email in rows}
+
+    def add(self, username, record):
+        try:
+            with self.lock, self.db:
+                self.db.execute(
+                    "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                    (username, record["password"], record.get("email")),
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update(self, username, **fields):
+        columns = [column for column in ("password", "email") if column in fields]
+        if not columns:
+            return self.get(username) is not None
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self.lock, self.db:
+            updated = self.db.execute(
+                f"UPDATE users SET {assignments} WHERE username = ?",
+                [fields[column] for column in columns] + [username],
+            ).rowcount
+        return updated > 0
+
+
+class StateUserStore:
+    """User records in the shared state backend, readable from every replica.
+
+    Existing users.json records are imported until one import has
+    finished. Importing only adds missing users, so an import that was
+    interrupted, or runs on two replicas at once, is simply repeated.
+    """
+
+    def __init__(self, backend=None, import_from=USERS_FILE):
+        self.backend = backend or get_state_backend()
+        if self.backend.get("meta", "users_imported") is None:
+            if import_from and os.path.exists(import_from):
+                for username, record in JsonUserStore(import_from).all().items():
+                    self.backend.add("users", username, record)
+            self.backend.set("meta", "users_imported", True)
+
+    def get(self, username):
+        return self.backend.get("users", username)
+
+    def all(self):
+        return self.backend.items("users")
+
+    def add(self, username, record):
+        return self.backend.add("users", username, dict(record))
+
+    def update(self, username, **fields):
+        # Compare-and-set, retried when another replica changed the record in between
+        while True:
+            record = self.backend.get("users", username)
+            if record is None:
+                return False
+            if self.backend.compare_and_set("users", username, record, dict(record, **fields)):
+                return True
+
+
+_user_store = None
+_user_store_lock = threading.Lock()
+
+
+def get_user_store():
+    """Return the process-wide user store for the configured backend."""
+    global _user_store
+    with _user_store_lock:
+        if _user_store is None:
+            if USER_BACKEND == "sqlite":
+                _user_store = SqliteUserStore()
+            elif USER_BACKEND == "state":
+                _user_store = StateUserStore()
+            else:
+                _user_store = JsonUserStore()
+    return _user_store
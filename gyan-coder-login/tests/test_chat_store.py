@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+import chat_store
+from chat_store import get_chat_store
+
+
+@pytest.fixture
+def stores(monkeypatch):
+    monkeypatch.setattr(chat_store, "OPEN_STORES", 2)
+    monkeypatch.setattr(chat_store, "_stores", chat_store.OrderedDict())
+    yield chat_store._stores
+    for store in chat_store._stores.values():
+        store.close()
+
+
+def test_get_chat_store_reuses_the_open_store(tmp_path, stores):
+    assert get_chat_store(tmp_path / "alice") is get_chat_store(tmp_path / "alice")
+
+
+def test_least_recently_used_store_is_closed(tmp_path, stores):
+    alice = get_chat_store(tmp_path / "alice")
+    bob = get_chat_store(tmp_path / "bob")
+    get_chat_store(tmp_path / "alice")
+    get_chat_store(tmp_path / "carol")
+    assert bob._db is None
+    assert alice._db is not None
+    assert len(stores) == 2
+
+
+def test_closed_store_reopens_when_used_again(tmp_path, stores):
+    alice = get_chat_store(tmp_path / "alice")
+    chat_id = alice.create_chat("first question")
+    alice.append_message(chat_id, {"role": "user", "text": "first question", "segments": []})
+    get_chat_store(tmp_path / "bob")
+    get_chat_store(tmp_path / "carol")
+    assert alice._db is None
+    assert [message["text"] for message in alice.load_messages(chat_id)] == ["first question"]
+    assert get_chat_store(tmp_path / "alice").count_chats() == 1
+
+
+def test_eviction_waits_for_a_thread_using_the_store(tmp_path, stores):
+    alice = get_chat_store(tmp_path / "alice")
+    get_chat_store(tmp_path / "bob")
+    evicted = threading.Event()
+
+    def open_another():
+        get_chat_store(tmp_path / "carol")
+        evicted.set()
+
+    with alice.lock:
+        thread = threading.Thread(target=open_another, daemon=True)
+        thread.start()
+        assert not evicted.wait(0.2)
+        assert alice.count_chats() == 0
+    assert evicted.wait(2)
+    assert alice._db is None
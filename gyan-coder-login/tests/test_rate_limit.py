@@ -0,0 +1,114 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import DeadlineExceeded, RateLimiter, TokenBucket, call_with_retry, retry_after_seconds
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(rate_limit.time, "sleep", delays.append)
+    return delays
+
+
+def test_bucket_allows_a_burst_up_to_capacity_then_queues():
+    bucket = TokenBucket(60)
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(1) == pytest.approx(2.0, abs=0.05)
+
+
+def test_bucket_caps_a_reservation_at_its_capacity():
+    bucket = TokenBucket(100)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.6, abs=0.05)
+
+
+def test_bucket_pause_delays_new_reservations():
+    bucket = TokenBucket(60)
+    bucket.pause(5)
+    assert bucket.reserve(1) == pytest.approx(5.0, abs=0.05)
+
+
+def test_limiter_refunds_a_reservation_past_the_deadline(sleeps):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=100)
+    limiter.acquire(100, time.monotonic() + 1)
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(50, time.monotonic() + 1)
+    # The refused request's tokens are back, so this one only waits for the first
+    limiter.acquire(50, time.monotonic() + 60)
+    assert sleeps == [pytest.approx(30.0, abs=0.5)]
+
+
+def test_limiter_with_zero_limits_never_waits(sleeps):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    for _ in range(100):
+        limiter.acquire(10_000, time.monotonic() + 1)
+    assert sleeps == []
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(ProviderError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "soon"})) is None
+    assert retry_after_seconds(ProviderError(429)) is None
+
+
+def test_call_with_retry_retries_transient_errors(sleeps):
+    outcomes = [ProviderError(503), ProviderError(429), "ok"]
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert call_with_retry(flaky, time.monotonic() + 60) == "ok"
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= rate_limit.BACKOFF_CAP for delay in sleeps)
+
+
+def test_call_with_retry_does_not_retry_client_errors(sleeps):
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise ProviderError(400)
+
+    with pytest.raises(ProviderError):
+        call_with_retry(bad_request, time.monotonic() + 60)
+    assert calls == [1] and sleeps == []
+
+
+def test_call_with_retry_honours_retry_after_and_pauses_the_limiter(sleeps):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=0)
+    outcomes = [ProviderError(429, {"retry-after": "3"}), "ok"]
+
+    def limited():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert call_with_retry(limited, time.monotonic() + 60, limiter) == "ok"
+    assert sleeps[0] >= 3
+    assert limiter.requests.reserve(1) == pytest.approx(3.0, abs=0.1)
+
+
+def test_call_with_retry_gives_up_at_the_deadline(sleeps):
+    def throttled():
+        raise ProviderError(429, {"retry-after": "30"})
+
+    with pytest.raises(ProviderError):
+        call_with_retry(throttled, time.monotonic() + 5)
+    assert sleeps == []
@@ -0,0 +1,177 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class FakeUpstream:
+    """Upstream stream that yields chunks when released, and records close()."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.released = threading.Semaphore(0)
+        self.closed = threading.Event()
+        self.pulled = 0
+
+    def release(self, count=1):
+        for _ in range(count):
+            self.released.release()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.chunks:
+            raise StopIteration
+        while not self.released.acquire(timeout=0.01):
+            if self.closed.is_set():
+                raise StopIteration
+        if self.closed.is_set():
+            raise StopIteration
+        self.pulled += 1
+        return self.chunks.pop(0)
+
+    def close(self):
+        self.closed.set()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_do_runs_func_once_for_concurrent_callers():
+    group = SingleFlight()
+    calls = []
+    started = threading.Event()
+    finish = threading.Event()
+
+    def func():
+        calls.append(1)
+        started.set()
+        finish.wait(2)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(group.do("key", func)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(group.do("key", func))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    assert wait_for(lambda: group.flights["key"].followers == 3)
+    finish.set()
+    for thread in [leader] + followers:
+        thread.join(2)
+
+    assert calls == [1]
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+    assert group.in_flight() == 0
+
+
+def test_do_raises_the_error_to_every_caller():
+    group = SingleFlight()
+
+    def func():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        group.do("key", func)
+    assert group.in_flight() == 0
+
+
+def test_stream_fans_out_every_chunk_to_late_followers():
+    group = SingleFlight()
+    upstream = FakeUpstream(["a", "b", "c"])
+    leader, shared = group.stream("key", lambda: upstream)
+    assert not shared
+    upstream.release()
+    assert next(leader) == "a"
+
+    follower, shared = group.stream("key", lambda: pytest.fail("a follower must not start a call"))
+    assert shared
+    upstream.release(2)
+    assert list(leader) == ["b", "c"]
+    assert list(follower) == ["a", "b", "c"]
+    assert wait_for(lambda: group.in_flight() == 0)
+    assert not upstream.closed.is_set()
+
+
+def test_stream_keeps_going_while_a_follower_reads():
+    group = SingleFlight()
+    upstream = FakeUpstream(["a", "b", "c"])
+    leader, _ = group.stream("key", lambda: upstream)
+    follower, _ = group.stream("key", lambda: upstream)
+    upstream.release()
+    assert next(leader) == "a"
+    leader.close()
+
+    upstream.release(2)
+    assert list(follower) == ["a", "b", "c"]
+    assert not upstream.closed.is_set()
+
+
+def test_stream_closes_upstream_when_every_reader_closes():
+    group = SingleFlight()
+    upstream = FakeUpstream(["a", "b", "c", "d"])
+    leader, _ = group.stream("key", lambda: upstream)
+    follower, _ = group.stream("key", lambda: upstream)
+    upstream.release()
+    assert next(leader) == "a"
+
+    leader.close()
+    assert not upstream.closed.is_set()
+    follower.close()
+    assert upstream.closed.is_set()
+    # An abandoned flight is forgotten at once, so a new caller starts its own call
+    assert group.in_flight() == 0
+    fresh = FakeUpstream(["x"])
+    reader, shared = group.stream("key", lambda: fresh)
+    assert not shared
+    fresh.release()
+    assert list(reader) == ["x"]
+
+
+def test_stream_closes_upstream_when_readers_are_dropped():
+    group = SingleFlight()
+    upstream = FakeUpstream(["a", "b"])
+    leader, _ = group.stream("key", lambda: upstream)
+    upstream.release()
+    assert next(leader) == "a"
+
+    del leader
+    gc.collect()
+    assert upstream.closed.is_set()
+    assert upstream.pulled == 1
+
+
+def test_stream_closes_upstream_when_the_leader_never_reads():
+    group = SingleFlight()
+    upstream = FakeUpstream(["a"])
+    leader, _ = group.stream("key", lambda: upstream)
+    leader.close()
+    assert upstream.closed.is_set()
+
+
+def test_stream_error_reaches_every_reader():
+    group = SingleFlight()
+
+    class Failing(FakeUpstream):
+        def __next__(self):
+            raise ConnectionError("upstream failed")
+
+    upstream = Failing([])
+    leader, _ = group.stream("key", lambda: upstream)
+    follower, _ = group.stream("key", lambda: upstream)
+    with pytest.raises(ConnectionError):
+        list(leader)
+    with pytest.raises(ConnectionError):
+        list(follower)
+    assert not upstream.closed.is_set()
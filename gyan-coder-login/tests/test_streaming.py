@@ -0,0 +1,150 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import gyancoder
+from gyancoder import ThinkFilter, clean_response, hedged_stream
+
+REPLY = "<think>Let me think about loops.</think>\n\nUse a `for` loop:\n\n```python\nfor i in range(3):\n    print(i)\n```"
+
+
+def filtered(chunks):
+    think_filter = ThinkFilter()
+    return "".join(think_filter.feed(chunk) for chunk in chunks) + think_filter.flush()
+
+
+def test_think_filter_matches_clean_response_for_every_split():
+    expected = clean_response(REPLY)
+    for split in range(len(REPLY) + 1):
+        assert filtered([REPLY[:split], REPLY[split:]]).strip() == expected
+
+
+def test_think_filter_handles_one_character_chunks():
+    assert filtered(list(REPLY)).strip() == clean_response(REPLY)
+
+
+def test_think_filter_holds_back_a_partial_tag_only_until_it_is_resolved():
+    think_filter = ThinkFilter()
+    assert think_filter.feed("Hello <thi") == "Hello "
+    assert think_filter.feed("s is not a tag") == "<this is not a tag"
+
+
+def test_think_filter_drops_an_unterminated_think_block():
+    assert filtered(["Answer. <think>still thinking", " when the stream ends"]) == "Answer. "
+
+
+def test_think_filter_strips_whitespace_left_by_a_leading_block():
+    assert filtered(["<think>x</think>", "\n\n", "  Hi"]) == "Hi"
+
+
+def chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    """Upstream stream yielding (delay, text) steps; close() ends it from any thread."""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.steps:
+            raise StopIteration
+        delay, text = self.steps.pop(0)
+        if self.closed.wait(delay):
+            raise StopIteration
+        if isinstance(text, Exception):
+            raise text
+        return chunk(text)
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeEngine:
+    """Stands in for LLMEngine, answering each model with a scripted stream."""
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.streams = {}
+
+    def stream(self, model, **params):
+        stream = FakeStream(self.scripts[model])
+        self.streams[model] = stream
+        return stream
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limits(monkeypatch):
+    monkeypatch.setattr(gyancoder, "get_rate_limiter", lambda: SimpleNamespace(
+        acquire=lambda tokens, deadline: None, charge=lambda tokens: None, pause=lambda seconds: None))
+
+
+def params(model):
+    return {"model": model, "messages": [{"role": "user", "content": "q"}], "stream": True}
+
+
+def texts(stream):
+    return [item.choices[0].delta.content for item in stream]
+
+
+def test_hedged_stream_keeps_a_fast_primary_without_hedging():
+    engine = FakeEngine({"strong": [(0, "Hel"), (0, "lo")], "fast": [(0, "hedge")]})
+    assert texts(hedged_stream(engine, params("strong"), params("fast"), 0.5)) == ["Hel", "lo"]
+    assert "fast" not in engine.streams
+
+
+def test_hedged_stream_switches_to_the_hedge_and_closes_the_primary():
+    engine = FakeEngine({"strong": [(5, "late")], "fast": [(0, "<think>x</think>"), (0, "quick"), (0, " answer")]})
+    started = time.monotonic()
+    result = texts(hedged_stream(engine, params("strong"), params("fast"), 0.05))
+    assert result == ["<think>x</think>", "quick", " answer"]
+    assert time.monotonic() - started < 2
+    assert engine.streams["strong"].closed.wait(1)
+
+
+def test_hedged_stream_only_counts_visible_text_as_the_first_token():
+    engine = FakeEngine({
+        "strong": [(0, "<think>"), (0.3, "pondering"), (0.3, "</think>Primary")],
+        "fast": [(0.05, "Hedge")],
+    })
+    assert texts(hedged_stream(engine, params("strong"), params("fast"), 0.05)) == ["Hedge"]
+    assert engine.streams["strong"].closed.wait(1)
+
+
+def test_hedged_stream_falls_back_to_the_hedge_when_the_primary_fails():
+    engine = FakeEngine({"strong": [(0.1, ConnectionError("reset"))], "fast": [(0.2, "ok")]})
+    assert texts(hedged_stream(engine, params("strong"), params("fast"), 0.05)) == ["ok"]
+
+
+def test_hedged_stream_raises_when_both_requests_fail():
+    engine = FakeEngine({"strong": [(0.1, ConnectionError("reset"))], "fast": [(0.1, TimeoutError("slow"))]})
+    with pytest.raises((ConnectionError, TimeoutError)):
+        texts(hedged_stream(engine, params("strong"), params("fast"), 0.05))
+
+
+def test_closing_a_hedged_stream_closes_both_requests():
+    engine = FakeEngine({"strong": [(5, "late")], "fast": [(5, "also late")]})
+    stream = hedged_stream(engine, params("strong"), params("fast"), 0.05)
+    reader = threading.Thread(target=texts, args=(stream,), daemon=True)
+    reader.start()
+    deadline = time.monotonic() + 2
+    while "fast" not in engine.streams and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stream.close()
+    assert engine.streams["strong"].closed.wait(1)
+    assert engine.streams["fast"].closed.wait(1)
+    reader.join(2)
+    assert not reader.is_alive()
+
+
+def test_open_stream_does_not_hedge_with_the_same_model(monkeypatch):
+    monkeypatch.setattr(gyancoder, "HEDGE_AFTER", 0.01)
+    engine = FakeEngine({"fast": [(0.1, "only")]})
+    assert texts(gyancoder.open_stream(engine, params("fast"), params("fast"))) == ["only"]